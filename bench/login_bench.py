@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Sign-in throughput at the configured password hashing cost.
+#
+#   python bench/login_bench.py [--logins 40] [--threads 8] [--method scrypt:32768:8:1]
+#
+# Runs in a scratch directory with one registered user. It reports the raw
+# hashes per second one core manages, then full POST /login round trips
+# from a number of concurrent clients, which auth_pool caps at AUTH_WORKERS
+# hashes in flight.
+import argparse, os, sys, tempfile, threading, time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--method", help="override PASSWORD_METHOD")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, REPO)
+    import mom
+
+    mom.init_db()
+    app = mom.create_app()
+    if args.method:
+        mom.PASSWORD_METHOD = args.method
+    with app.app_context():
+        c = mom.get_db_conn().cursor()
+        c.execute("INSERT INTO users(fullname, username, email, password, age) VALUES (?, ?, ?, ?, ?)",
+                  ("Bench", "bench", "bench@example.com", mom.hash_password("secret"), 30))
+        c.connection.commit()
+    print(f"method: {mom.PASSWORD_METHOD}  auth workers: {mom.AUTH_WORKERS}  "
+          f"cpus: {os.cpu_count()}")
+
+    stored = mom.hash_password("secret")
+    start = time.perf_counter()
+    for _ in range(10):
+        assert mom.verify_password(stored, "secret")
+    per_hash = (time.perf_counter() - start) / 10
+    print(f"one core:  {1 / per_hash:6.1f} hashes/s ({per_hash * 1000:.1f} ms each)")
+
+    statuses = []
+
+    def worker(count):
+        client = app.test_client()
+        for _ in range(count):
+            response = client.post("/login", data={"username": "bench", "password": "secret"})
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(args.logins // args.threads,))
+               for _ in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done = statuses.count(302)
+    print(f"/login:    {done / elapsed:6.1f} logins/s with {args.threads} clients "
+          f"({done} ok, {statuses.count(503)} refused with 503)")
+
+
+if __name__ == "__main__":
+    main()
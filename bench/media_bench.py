@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Throughput of the /media/ endpoint: whole-file downloads and the small
+# Range requests a browser makes while scrubbing through a video.
+#
+#   python bench/media_bench.py [--size-mb 64] [--ranges 200] [--url URL]
+#
+# Without --url it starts the app on a local werkzeug server in a scratch
+# directory with one generated video. werkzeug has no wsgi.file_wrapper, so
+# that measures the plain-Python path; point --url at a gunicorn (sendfile)
+# or nginx (MEDIA_ACCEL_PREFIX) deployment to compare.
+import argparse, http.client, logging, os, random, sys, tempfile, threading, time
+from urllib.parse import urlsplit
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_local_server(size_mb):
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, REPO)
+    import mom
+    from werkzeug.serving import make_server
+
+    mom.init_db()
+    app = mom.create_app()
+
+    src = os.path.join(mom.UPLOAD_TMP, "bench.mp4")
+    with open(src, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+    name = mom.add_media_file(src, ".mp4", move=True)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/media/{name}"
+
+
+def fetch(conn, path, headers=None):
+    conn.request("GET", path, headers=headers or {})
+    response = conn.getresponse()
+    body = response.read()
+    return response.status, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--downloads", type=int, default=5)
+    parser.add_argument("--ranges", type=int, default=200)
+    parser.add_argument("--range-kb", type=int, default=512)
+    parser.add_argument("--url", help="media URL of an already running server")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url or start_local_server(args.size_mb))
+    conn = http.client.HTTPConnection(url.hostname, url.port)
+
+    status, size = fetch(conn, url.path)
+    assert status == 200, status
+    print(f"file: {size / 2**20:.1f} MB  {url.geturl()}")
+
+    start = time.perf_counter()
+    for _ in range(args.downloads):
+        fetch(conn, url.path)
+    elapsed = time.perf_counter() - start
+    print(f"full downloads: {args.downloads * size / 2**20 / elapsed:8.1f} MB/s "
+          f"({elapsed / args.downloads * 1000:.1f} ms each)")
+
+    span = args.range_kb * 1024
+    offsets = [random.randrange(0, max(size - span, 1)) for _ in range(args.ranges)]
+    sent = 0
+    start = time.perf_counter()
+    for offset in offsets:
+        status, n = fetch(conn, url.path, {"Range": f"bytes={offset}-{offset + span - 1}"})
+        assert status == 206, status
+        sent += n
+    elapsed = time.perf_counter() - start
+    print(f"range requests: {args.ranges / elapsed:8.1f} req/s, {sent / 2**20 / elapsed:.1f} MB/s "
+          f"({sent / 2**20:.1f} MB sent; whole-file replies would have been "
+          f"{args.ranges * size / 2**20:.0f} MB)")
+
+
+if __name__ == "__main__":
+    main()
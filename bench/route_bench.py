@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Latency and SQL query counts of the main pages, driven through the Flask
+# test client against seeded data.
+#
+#   python bench/route_bench.py [--users 2000] [--requests 50] [--dir DIR]
+#
+# Without --dir it seeds a scratch directory with bench/seed.py; with it,
+# it uses the database already there (seeded accounts sign in with
+# seed.SEED_PASSWORD). Every statement SQLite runs for a request is
+# counted, except those inside triggers and FTS5. A route that runs more
+# queries than its budget in QUERY_BUDGETS makes the run exit with status
+# 1, so CI catches N+1 regressions:
+#
+#   python bench/route_bench.py --users 300 --requests 5
+import argparse, os, statistics, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import seed
+import mom
+
+# Most statements one request to the route may run: what it needs with
+# the user cache cold, so an expired cache entry never trips a budget
+QUERY_BUDGETS = {
+    "/feed": 4,
+    "/profile/<username>": 6,
+    "/direct": 3,
+    "/chat/<username>": 8,
+    "/search (prefix)": 3,
+    "/search (full text)": 3,
+}
+
+
+class QueryCounter:
+    # Wraps connect_db so every connection reports its statements here
+    def __init__(self):
+        self.queries = 0
+        self.connections = 0
+        self._connect = mom.connect_db
+        mom.connect_db = self.connect
+
+    def connect(self):
+        conn = self._connect()
+        conn.set_trace_callback(self.trace)
+        self.connections += 1
+        return conn
+
+    def trace(self, sql):
+        # Statements run inside triggers and virtual tables come prefixed
+        # with "--"; FTS5 also reads its config as 'main'.-qualified SQL
+        if not sql.startswith("--") and "'main'." not in sql:
+            self.queries += 1
+
+    def reset(self):
+        self.queries = self.connections = 0
+
+
+def pick_targets(conn):
+    # The signed-in reader follows the most accounts among those with chats;
+    # the profile is the most followed account
+    viewer = conn.execute("""
+        SELECT id, username FROM users u
+        WHERE EXISTS (SELECT 1 FROM inbox WHERE user_id = u.id)
+        ORDER BY following_count DESC LIMIT 1
+    """).fetchone()
+    star = conn.execute("SELECT username FROM users ORDER BY followers_count DESC LIMIT 1").fetchone()
+    partner = conn.execute("""
+        SELECT u.username FROM inbox i JOIN users u ON u.id = i.partner_id
+        WHERE i.user_id = ? ORDER BY i.ts DESC LIMIT 1
+    """, (viewer["id"],)).fetchone()
+    return viewer["username"], {
+        "/feed": "/feed",
+        "/profile/<username>": f"/profile/{star['username']}",
+        "/direct": "/direct",
+        "/chat/<username>": f"/chat/{partner['username']}",
+        "/search (prefix)": "/search?query=ad",
+        "/search (full text)": "/search?query=smith",
+    }
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", help="directory holding an already seeded users.db")
+    parser.add_argument("--users", type=int, default=2000, help="accounts to seed")
+    parser.add_argument("--requests", type=int, default=50, help="timed requests per route")
+    args = parser.parse_args()
+
+    if args.dir:
+        os.chdir(args.dir)
+        mom.init_db()
+    else:
+        os.chdir(tempfile.mkdtemp())
+        print("seeded:", ", ".join(f"{n} {what}" for what, n in seed.seed(users=args.users).items()))
+
+    conn = mom.connect_db()
+    username, routes = pick_targets(conn)
+    conn.close()
+
+    app = mom.create_app()
+    client = app.test_client()
+    response = client.post("/login", data={"username": username, "password": seed.SEED_PASSWORD})
+    assert response.status_code == 302, "could not sign in as " + username
+    counter = QueryCounter()
+
+    print(f"{'route':22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} "
+          f"{'budget':>7} {'conns':>6}")
+    over = []
+    for name, path in routes.items():
+        client.get(path)
+        times, queries, connections = [], [], []
+        for _ in range(args.requests):
+            counter.reset()
+            start = time.perf_counter()
+            response = client.get(path)
+            times.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, (path, response.status_code)
+            queries.append(counter.queries)
+            connections.append(counter.connections)
+
+        budget = QUERY_BUDGETS[name]
+        if max(queries) > budget:
+            over.append(name)
+        print(f"{name:22} {statistics.median(times):8.2f} {percentile(times, 95):8.2f} "
+              f"{percentile(times, 99):8.2f} {max(queries):8} {budget:7} {max(connections):6}"
+              + ("  OVER BUDGET" if max(queries) > budget else ""))
+
+    if over:
+        print("Query budget exceeded:", ", ".join(over))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
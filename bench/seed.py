@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# Fills a database with synthetic users, a power-law follower graph, posts,
+# likes, comments and chats, for benchmarks and local testing.
+#
+#   python bench/seed.py [--users 5000] [--follows 30] [--posts 5] ...
+#
+# Works in the current directory like the app does (users.db, media/),
+# migrating the schema first. Every seeded account signs in with the
+# password SEED_PASSWORD.
+import argparse, os, random, sys, tempfile, time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+import mom
+
+SEED_PASSWORD = "password"
+DAY = 24 * 3600
+
+FIRST_NAMES = ("Ada", "Ben", "Cara", "Dev", "Elif", "Femi", "Gus", "Hana", "Ivan", "Juno", "Kai",
+               "Lena", "Milo", "Nia", "Omar", "Pia", "Quinn", "Rosa", "Sam", "Tara", "Uma",
+               "Vic", "Wen", "Xena", "Yusuf", "Zoe")
+LAST_NAMES = ("Abe", "Brown", "Costa", "Diaz", "Evans", "Fox", "Garcia", "Hill", "Ito", "Jones",
+              "Kim", "Lopez", "Meyer", "Novak", "Okafor", "Patel", "Quist", "Rossi", "Smith",
+              "Tanaka", "Ueda", "Vance", "Wright", "Xu", "Young", "Zhou")
+WORDS = ("sunset", "coffee", "city", "beach", "friends", "weekend", "mountains", "dinner",
+         "throwback", "music", "run", "rain", "garden", "road", "trip", "art", "books", "night")
+
+
+def sentence(rng, words=6):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, words)))
+
+
+def count(rng, mean):
+    # Long-tailed per-item counts with the given mean
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+
+def placeholder_media():
+    # Pages only link to media, so every post and profile shares one file
+    with tempfile.NamedTemporaryFile(dir=mom.UPLOAD_TMP, delete=False) as f:
+        f.write(b"seed")
+    return mom.add_media_file(f.name, ".jpg", move=True)
+
+
+def seed(users=5000, follows=30, posts=5, likes=10, comments=2, chats=2, messages=20,
+         alpha=1.1, days=30, random_seed=1):
+    rng = random.Random(random_seed)
+    os.makedirs(mom.UPLOAD_TMP, exist_ok=True)
+    mom.init_db()
+    conn = mom.connect_db()
+    c = conn.cursor()
+    now = int(time.time())
+    start = now - days * DAY
+    photo = placeholder_media()
+    password = mom.hash_password(SEED_PASSWORD)
+    c.execute("BEGIN")
+
+    first_id = (c.execute("SELECT MAX(id) FROM users").fetchone()[0] or 0) + 1
+    ids = list(range(first_id, first_id + users))
+    user_rows = []
+    for uid in ids:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        user_rows.append((f"{first} {last}", f"{first}{last}{uid}".lower(),
+                          f"user{uid}@example.com", password, rng.randint(16, 70), photo))
+    c.executemany("""
+        INSERT INTO users(id, fullname, username, email, password, age, photo)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, ((uid,) + row for uid, row in zip(ids, user_rows)))
+
+    # Popularity follows a Zipf law over a random order of the accounts, so
+    # a few have a large share of all followers and most have a handful
+    ranked = ids[:]
+    rng.shuffle(ranked)
+    weights, total = [], 0.0
+    for rank in range(users):
+        total += 1 / (rank + 1) ** alpha
+        weights.append(total)
+
+    edges = set()
+    for uid in ids:
+        want = min(max(1, count(rng, follows)), users - 1)
+        picked = set()
+        for target in rng.choices(ranked, cum_weights=weights, k=want * 2):
+            if target != uid:
+                picked.add(target)
+            if len(picked) == want:
+                break
+        edges.update((target, uid) for target in picked)
+    c.executemany("INSERT OR IGNORE INTO followers(user_id, follower_id) VALUES (?, ?)", edges)
+
+    def at(ts):
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(ts))
+
+    post_rows = []
+    for uid in ids:
+        for _ in range(count(rng, posts)):
+            ts = rng.randint(start, now)
+            post_rows.append((uid, sentence(rng), photo, "image", at(ts), ts))
+    post_rows.sort(key=lambda row: row[5])
+    c.executemany("""
+        INSERT INTO posts(user_id, caption, media, media_type, timestamp, ts)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, post_rows)
+    c.execute("SELECT id, ts FROM posts WHERE user_id >= ?", (first_id,))
+    post_ids = c.fetchall()
+
+    like_rows, comment_rows = [], []
+    for post_id, ts in post_ids:
+        for uid in set(rng.choices(ids, k=min(count(rng, likes), users))):
+            like_rows.append((post_id, uid))
+        for _ in range(count(rng, comments)):
+            when = rng.randint(ts, now)
+            comment_rows.append((post_id, rng.choice(ids), sentence(rng, 10), at(when), when))
+    c.executemany("INSERT OR IGNORE INTO likes(post_id, user_id) VALUES (?, ?)", like_rows)
+    comment_rows.sort(key=lambda row: row[4])
+    c.executemany("""
+        INSERT INTO comments(post_id, user_id, comment, timestamp, ts) VALUES (?, ?, ?, ?, ?)
+    """, comment_rows)
+
+    # Chats run between an account and people it follows
+    following = {}
+    for target, follower in edges:
+        following.setdefault(follower, []).append(target)
+    message_rows = []
+    for uid in ids:
+        partners = following.get(uid, [])
+        for partner in rng.sample(partners, min(count(rng, chats), len(partners))):
+            when = rng.randint(start, now)
+            for _ in range(max(1, count(rng, messages))):
+                when = min(now, when + rng.randint(5, 3600))
+                sender, receiver = rng.choice(((uid, partner), (partner, uid)))
+                message_rows.append((sender, receiver, sentence(rng, 12), at(when), when,
+                                     mom.conversation_key(sender, receiver)))
+    message_rows.sort(key=lambda row: row[4])
+    c.executemany("""
+        INSERT INTO messages(sender_id, receiver_id, message, timestamp, ts, conversation_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, message_rows)
+    c.execute("UPDATE inbox SET unread = 0, last_read_id = last_message_id WHERE user_id >= ?",
+              (first_id,))
+
+    # Feeds as the app would have built them one post at a time
+    c.execute("UPDATE users SET celebrity = 1 WHERE followers_count >= ?", (mom.FANOUT_LIMIT,))
+    c.execute("""
+        INSERT OR IGNORE INTO timeline(user_id, post_id, author_id, ts)
+        SELECT user_id, id, user_id, ts FROM posts WHERE user_id >= ?
+    """, (first_id,))
+    c.execute("""
+        INSERT OR IGNORE INTO timeline(user_id, post_id, author_id, ts)
+        SELECT f.follower_id, p.id, p.user_id, p.ts
+        FROM posts p
+        JOIN followers f ON f.user_id = p.user_id
+        JOIN users u ON u.id = p.user_id
+        WHERE u.celebrity = 0 AND p.user_id >= ?
+    """, (first_id,))
+    conn.commit()
+    conn.close()
+
+    return {"users": users, "follows": len(edges), "posts": len(post_rows),
+            "likes": len(like_rows), "comments": len(comment_rows),
+            "messages": len(message_rows)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic data.")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--follows", type=float, default=30, help="mean accounts each user follows")
+    parser.add_argument("--posts", type=float, default=5, help="mean posts per user")
+    parser.add_argument("--likes", type=float, default=10, help="mean likes per post")
+    parser.add_argument("--comments", type=float, default=2, help="mean comments per post")
+    parser.add_argument("--chats", type=float, default=2, help="mean conversations started per user")
+    parser.add_argument("--messages", type=float, default=20, help="mean messages per conversation")
+    parser.add_argument("--alpha", type=float, default=1.1, help="Zipf exponent of popularity")
+    parser.add_argument("--days", type=int, default=30, help="how far back activity goes")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = seed(args.users, args.follows, args.posts, args.likes, args.comments, args.chats,
+                  args.messages, args.alpha, args.days, args.seed)
+    print(", ".join(f"{n} {what}" for what, n in counts.items()),
+          f"in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Cold start of one worker process: importing mom, create_app(), and the
+# first request it serves.
+#
+#   python bench/startup_bench.py [--runs 10] [--users 50000]
+#
+# Runs in a scratch directory holding a migrated database with --users
+# rows, starting a fresh interpreter for every run. With preload_app (see
+# gunicorn.conf.py) import and create_app() happen once in the master, so
+# a forked worker only pays for its first request.
+import argparse, json, os, statistics, subprocess, sys, tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import mom
+imported = time.perf_counter()
+app = mom.create_app()
+created = time.perf_counter()
+app.test_client().get("/")
+served = time.perf_counter()
+print(json.dumps({"import": imported - start, "create_app": created - imported,
+                  "first request": served - created}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--users", type=int, default=50000)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, REPO)
+    import mom
+
+    mom.init_db()
+    conn = mom.connect_db()
+    conn.executemany("INSERT INTO users(fullname, username, email, password, age) VALUES (?, ?, ?, ?, ?)",
+                     ((f"User {i}", f"user{i}", f"user{i}@example.com", "x", 30)
+                      for i in range(args.users)))
+    conn.commit()
+    conn.close()
+
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, "-c", CHILD, REPO], capture_output=True,
+                             text=True, check=True).stdout
+        runs.append(json.loads(out))
+
+    print(f"{args.users} users, median of {args.runs} runs")
+    for step in runs[0]:
+        print(f"  {step:14} {statistics.median(r[step] for r in runs) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# One process per core, each with a pool of threads. Requests mostly wait
+# on SQLite and the network, so threads go further than extra processes.
+# An open chat window holds one thread for its event stream; each process
+# runs at most MOM_SSE_MAX_STREAMS (default 8) streams and lets further
+# chats poll instead, so keep that well under THREADS.
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+# Each worker hashes passwords on MOM_AUTH_WORKERS threads (default 1), so
+# up to workers * MOM_AUTH_WORKERS scrypt hashes of 32 MB run at once.
+# Raise it only when running fewer workers than cores.
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", 16))
+# A sign-in waiting for the hashing thread holds a request thread, so each
+# worker lets MOM_AUTH_QUEUE (default 4) wait and refuses the rest with a
+# 503. Keep MOM_AUTH_WORKERS + MOM_AUTH_QUEUE well under THREADS.
+
+# wsgi.py is imported and the app built once in the master, then forked,
+# so a new or restarted worker serves its first request straight away.
+# Nothing opens a database connection or starts a thread before the fork.
+preload_app = True
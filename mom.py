@@ -1,1351 +1,2873 @@
-# -*- coding: utf-8 -*-
-# --- PART 1/7 START ---
-
-#!/usr/bin/env python3
-from flask import Flask, request, redirect, session, render_template_string
-import sqlite3, os, datetime
-from werkzeug.utils import secure_filename
-
-app = Flask(__name__)
-app.secret_key = "supersecret"
-
-# -------------- STATIC FOLDERS --------------
-if not os.path.exists("static"):
-    os.makedirs("static")
-if not os.path.exists("static/photos"):
-    os.makedirs("static/photos")
-if not os.path.exists("static/posts"):
-    os.makedirs("static/posts")
-
-DB_PATH = "users.db"
-
-# -------------- DB CONNECTION --------------
-def get_db_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-# -------------- INIT DATABASE --------------
-def init_db():
-    conn = get_db_conn()
-    c = conn.cursor()
-
-    # USERS TABLE - Remove height column if exists
-    c.execute("PRAGMA table_info(users)")
-    columns = [col[1] for col in c.fetchall()]
-    
-    if 'height' in columns:
-        # Create temporary table without height
-        c.execute("""
-        CREATE TABLE users_new(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fullname TEXT,
-            username TEXT UNIQUE,
-            email TEXT UNIQUE,
-            password TEXT,
-            age TEXT,
-            photo TEXT
-        );
-        """)
-        
-        # Copy data without height column
-        c.execute("""
-        INSERT INTO users_new (id, fullname, username, email, password, age, photo)
-        SELECT id, fullname, username, email, password, age, photo FROM users
-        """)
-        
-        # Drop old table and rename new one
-        c.execute("DROP TABLE users")
-        c.execute("ALTER TABLE users_new RENAME TO users")
-    else:
-        # Create fresh table
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS users(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fullname TEXT,
-            username TEXT UNIQUE,
-            email TEXT UNIQUE,
-            password TEXT,
-            age TEXT,
-            photo TEXT
-        );
-        """)
-
-    # FOLLOWERS TABLE
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS followers(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        follower_id INTEGER,
-        UNIQUE(user_id, follower_id)
-    );
-    """)
-
-    # POSTS TABLE
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS posts(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        caption TEXT,
-        media TEXT,
-        media_type TEXT,
-        timestamp TEXT
-    );
-    """)
-
-    # LIKES TABLE
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS likes(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        post_id INTEGER,
-        user_id INTEGER,
-        UNIQUE(post_id, user_id)
-    );
-    """)
-
-    # COMMENTS TABLE
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS comments(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        post_id INTEGER,
-        user_id INTEGER,
-        comment TEXT,
-        timestamp TEXT
-    );
-    """)
-
-    # MESSAGES TABLE — CHAT SYSTEM
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS messages(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sender_id INTEGER,
-        receiver_id INTEGER,
-        message TEXT,
-        timestamp TEXT
-    );
-    """)
-
-    conn.commit()
-    conn.close()
-
-
-init_db()
-
-# ----------- BASIC USER FUNCTIONS -----------
-def fetch_user_by_username(username):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username=?", (username,))
-    user = c.fetchone()
-    conn.close()
-    return user
-
-
-def fetch_user_by_id(uid):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE id=?", (uid,))
-    user = c.fetchone()
-    conn.close()
-    return user
-
-
-def refresh_session_user():
-    if "user" not in session:
-        return
-    username = session["user"][2]
-    user = fetch_user_by_username(username)
-    if user:
-        session["user"] = tuple(user)
-
-
-def followers_count(uid):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) AS cnt FROM followers WHERE user_id=?", (uid,))
-    count = c.fetchone()["cnt"]
-    conn.close()
-    return count
-
-
-def following_count(uid):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) AS cnt FROM followers WHERE follower_id=?", (uid,))
-    count = c.fetchone()["cnt"]
-    conn.close()
-    return count
-
-
-def is_following(target_id, visitor_id):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute(
-        "SELECT 1 FROM followers WHERE user_id=? AND follower_id=?",
-        (target_id, visitor_id),
-    )
-    r = c.fetchone()
-    conn.close()
-    return bool(r)
-
-
-def detect_media_type(filename):
-    ext = os.path.splitext(filename.lower())[1]
-    if ext in (".mp4", ".mov", ".webm", ".mkv", ".ogg"):
-        return "video"
-    return "image"
-
-
-def get_user_posts(uid):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute(
-        "SELECT * FROM posts WHERE user_id=? ORDER BY datetime(timestamp) DESC",
-        (uid,),
-    )
-    posts = c.fetchall()
-    conn.close()
-    return posts
-
-
-def get_like_count(pid):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) AS cnt FROM likes WHERE post_id=?", (pid,))
-    count = c.fetchone()["cnt"]
-    conn.close()
-    return count
-
-
-def get_comment_count(pid):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) AS cnt FROM comments WHERE post_id=?", (pid,))
-    count = c.fetchone()["cnt"]
-    conn.close()
-    return count
-
-
-def is_liked(pid, uid):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM likes WHERE post_id=? AND user_id=?", (pid, uid))
-    result = c.fetchone()
-    conn.close()
-    return bool(result)
-
-
-def format_time(timestamp):
-    try:
-        dt = datetime.datetime.fromisoformat(timestamp)
-        now = datetime.datetime.now()
-        diff = now - dt
-        if diff.days > 0:
-            return f"{diff.days}d"
-        elif diff.seconds > 3600:
-            return f"{diff.seconds // 3600}h"
-        elif diff.seconds > 60:
-            return f"{diff.seconds // 60}m"
-        else:
-            return "now"
-    except:
-        return timestamp
-
-# --- PART 1/7 END ---
-# --- PART 2/7 START ---
-
-# ---------------- GLOBAL CSS -----------------
-momentum_css = """
-<style>
-    :root {
-        --border-gray: #dbdbdb;
-        --text-light: #737373;
-        --bg-light: #fafafa;
-        --btn-blue: #0095f6;
-        --btn-hover: #1877f2;
-        --red: #ed4956;
-    }
-    * {
-        -webkit-user-select: none;
-        -moz-user-select: none;
-        -ms-user-select: none;
-        user-select: none;
-        -webkit-touch-callout: none;
-        -webkit-tap-highlight-color: transparent;
-    }
-    html, body {
-        margin: 0;
-        padding: 0;
-        width: 100%;
-        height: 100%;
-        overflow: hidden;
-        position: fixed;
-        font-family: Arial, sans-serif;
-        background: var(--bg-light);
-        touch-action: manipulation;
-        -webkit-text-size-adjust: 100%;
-        -ms-text-size-adjust: 100%;
-        text-size-adjust: 100%;
-    }
-    body {
-        zoom: 1;
-        max-zoom: 1;
-        min-zoom: 1;
-    }
-    .app-container {
-        max-width: 100%;
-        margin: 0 auto;
-        padding: 15px;
-        padding-top: 70px;
-        padding-bottom: 70px;
-        height: calc(100vh - 140px);
-        overflow-y: auto;
-        -webkit-overflow-scrolling: touch;
-        box-sizing: border-box;
-    }
-    .btn {
-        background: var(--btn-blue);
-        padding: 12px 18px;
-        color: white;
-        border-radius: 8px;
-        border: none;
-        cursor: pointer;
-        text-decoration: none;
-        display: inline-block;
-        font-size: 14px;
-        font-weight: 600;
-        text-align: center;
-    }
-    .btn:hover {
-        background: var(--btn-hover);
-    }
-    .btn-outline {
-        border: 1px solid var(--border-gray);
-        padding: 12px 18px;
-        border-radius: 8px;
-        background: white;
-        cursor: pointer;
-        text-decoration: none;
-        color: black;
-        font-size: 14px;
-        font-weight: 600;
-        text-align: center;
-    }
-    .form-input {
-        width: 100%;
-        padding: 14px;
-        margin-top: 8px;
-        margin-bottom: 16px;
-        border: 1px solid var(--border-gray);
-        border-radius: 8px;
-        box-sizing: border-box;
-        font-size: 16px;
-        background: white;
-    }
-    .file-input {
-        width: 100%;
-        padding: 14px;
-        margin-top: 8px;
-        margin-bottom: 16px;
-        border: 2px dashed var(--border-gray);
-        border-radius: 8px;
-        box-sizing: border-box;
-        font-size: 16px;
-        background: #f8f9fa;
-        text-align: center;
-        cursor: pointer;
-    }
-    .file-input:hover {
-        border-color: var(--btn-blue);
-        background: #f0f8ff;
-    }
-    .nav-bar {
-        height: 60px;
-        border-bottom: 1px solid var(--border-gray);
-        background: white;
-        display: flex;
-        justify-content: space-between;
-        padding: 0 20px;
-        align-items: center;
-        position: fixed;
-        top: 0;
-        left: 0;
-        right: 0;
-        z-index: 1000;
-        box-sizing: border-box;
-    }
-    .bottom-nav {
-        position: fixed;
-        bottom: 0;
-        left: 0;
-        right: 0;
-        height: 60px;
-        background: white;
-        border-top: 1px solid var(--border-gray);
-        display: flex;
-        justify-content: space-around;
-        align-items: center;
-        z-index: 1000;
-        box-sizing: border-box;
-    }
-    .nav-icon {
-        text-decoration: none;
-        color: black;
-        padding: 12px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        border-radius: 8px;
-    }
-    .nav-icon.active {
-        background: #f0f0f0;
-    }
-    .icon {
-        width: 24px;
-        height: 24px;
-        fill: currentColor;
-    }
-    .welcome-container {
-        max-width: 400px;
-        margin: 100px auto;
-        padding: 30px 20px;
-        text-align: center;
-        box-sizing: border-box;
-    }
-    .welcome-title {
-        font-size: 32px;
-        font-weight: bold;
-        margin-bottom: 20px;
-        color: #333;
-    }
-    .welcome-subtitle {
-        color: #666;
-        margin-bottom: 30px;
-        line-height: 1.5;
-        font-size: 16px;
-    }
-    .post-grid {
-        display: grid;
-        grid-template-columns: repeat(3, 1fr);
-        gap: 2px;
-        margin-top: 20px;
-    }
-    .post-grid-item {
-        aspect-ratio: 1;
-        overflow: hidden;
-        background: #f0f0f0;
-    }
-    .post-grid-item img,
-    .post-grid-item video {
-        width: 100%;
-        height: 100%;
-        object-fit: cover;
-        display: block;
-    }
-    .media-preview {
-        width: 100%;
-        max-height: 400px;
-        object-fit: contain;
-        background: #000;
-        border-radius: 8px;
-        margin-bottom: 15px;
-    }
-</style>
-"""
-
-# SVG ICONS
-SVG_ICONS = {
-    'home': '<svg class="icon" viewBox="0 0 24 24"><path d="M10 20v-6h4v6h5v-8h3L12 3 2 12h3v8z"/></svg>',
-    'search': '<svg class="icon" viewBox="0 0 24 24"><path d="M15.5 14h-.79l-.28-.27C15.41 12.59 16 11.11 16 9.5 16 5.91 13.09 3 9.5 3S3 5.91 3 9.5 5.91 16 9.5 16c1.61 0 3.09-.59 4.23-1.57l.27.28v.79l5 4.99L20.49 19l-4.99-5zm-6 0C7.01 14 5 11.99 5 9.5S7.01 5 9.5 5 14 7.01 14 9.5 11.99 14 9.5 14z"/></svg>',
-    'add': '<svg class="icon" viewBox="0 0 24 24"><path d="M19 13h-6v6h-2v-6H5v-2h6V5h2v6h6v2z"/></svg>',
-    'message': '<svg class="icon" viewBox="0 0 24 24"><path d="M20 2H4c-1.1 0-1.99.9-1.99 2L2 22l4-4h14c1.1 0 2-.9 2-2V4c0-1.1-.9-2-2-2zm-2 12H6v-2h12v2zm0-3H6V9h12v2zm0-3H6V6h12v2z"/></svg>',
-    'profile': '<svg class="icon" viewBox="0 0 24 24"><path d="M12 12c2.21 0 4-1.79 4-4s-1.79-4-4-4-4 1.79-4 4 1.79 4 4 4zm0 2c-2.67 0-8 1.34-8 4v2h16v-2c0-2.66-5.33-4-8-4z"/></svg>',
-    'settings': '<svg class="icon" viewBox="0 0 24 24"><path d="M19.14 12.94c.04-.3.06-.61.06-.94 0-.32-.02-.64-.07-.94l2.03-1.58c.18-.14.23-.41.12-.61l-1.92-3.32c-.12-.22-.37-.29-.59-.22l-2.39.96c-.5-.38-1.03-.7-1.62-.94l-.36-2.54c-.04-.24-.24-.41-.48-.41h-3.84c-.24 0-.43.17-.47.41l-.36 2.54c-.59.24-1.13.57-1.62.94l-2.39-.96c-.22-.08-.47 0-.59.22L2.74 8.87c-.12.21-.08.47.12.61l2.03 1.58c-.05.3-.09.63-.09.94s.02.64.07.94l-2.03 1.58c-.18.14-.23.41-.12.61l1.92 3.32c.12.22.37.29.59.22l2.39-.96c.5.38 1.03.7 1.62.94l.36 2.54c.05.24.24.41.48.41h3.84c.24 0 .44-.17.47-.41l.36-2.54c.59-.24 1.13-.56 1.62-.94l2.39.96c.22.08.47 0 .59-.22l1.92-3.32c.12-.22.07-.47-.12-.61l-2.01-1.58zM12 15.6c-1.98 0-3.6-1.62-3.6-3.6s1.62-3.6 3.6-3.6 3.6 1.62 3.6 3.6-1.62 3.6-3.6 3.6z"/></svg>',
-    'heart': '<svg class="icon" viewBox="0 0 24 24"><path d="M12 21.35l-1.45-1.32C5.4 15.36 2 12.28 2 8.5 2 5.42 4.42 3 7.5 3c1.74 0 3.41.81 4.5 2.09C13.09 3.81 14.76 3 16.5 3 19.58 3 22 5.42 22 8.5c0 3.78-3.4 6.86-8.55 11.54L12 21.35z"/></svg>',
-    'heart_outline': '<svg class="icon" viewBox="0 0 24 24"><path d="M16.5 3c-1.74 0-3.41.81-4.5 2.09C10.91 3.81 9.24 3 7.5 3 4.42 3 2 5.42 2 8.5c0 3.78 3.4 6.86 8.55 11.54L12 21.35l1.45-1.32C18.6 15.36 22 12.28 22 8.5 22 5.42 19.58 3 16.5 3zm-4.4 15.55l-.1.1-.1-.1C7.14 14.24 4 11.39 4 8.5 4 6.5 5.5 5 7.5 5c1.54 0 3.04.99 3.57 2.36h1.87C13.46 5.99 14.96 5 16.5 5c2 0 3.5 1.5 3.5 3.5 0 2.89-3.14 5.74-7.9 10.05z"/></svg>',
-    'comment': '<svg class="icon" viewBox="0 0 24 24"><path d="M21 6h-2v9H6v2c0 .55.45 1 1 1h11l4 4V7c0-.55-.45-1-1-1zm-4 6V3c0-.55-.45-1-1-1H3c-.55 0-1 .45-1 1v14l4-4h11c.55 0 1-.45 1-1z"/></svg>'
-}
-
-
-# ---------------- HEADER FUNCTION -----------------
-def get_header(user, current_page=""):
-    # Use dictionary access instead of tuple unpacking to handle different user formats
-    if isinstance(user, dict):
-        username = user["username"]
-    else:
-        # Handle tuple format - try both 7 and 8 field versions
-        try:
-            if len(user) == 8:  # Old format with height
-                uid, fullname, username, email, password, age, height, photo = user
-            else:  # New format without height
-                uid, fullname, username, email, password, age, photo = user
-        except:
-            # Fallback to index access
-            username = user[2] if len(user) > 2 else "user"
-
-    return f"""
-    <div class='nav-bar'>
-        <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
-        <div style="font-size:22px; font-weight:700;">Momentum</div>
-        <a class='nav-icon' href="/settings">{SVG_ICONS['settings']}</a>
-    </div>
-    """
-
-
-# ---------------- BOTTOM NAV FUNCTION -----------------
-def get_bottom_nav(user, current_page=""):
-    # Use dictionary access instead of tuple unpacking
-    if isinstance(user, dict):
-        username = user["username"]
-    else:
-        # Handle tuple format - try both 7 and 8 field versions
-        try:
-            if len(user) == 8:  # Old format with height
-                uid, fullname, username, email, password, age, height, photo = user
-            else:  # New format without height
-                uid, fullname, username, email, password, age, photo = user
-        except:
-            # Fallback to index access
-            username = user[2] if len(user) > 2 else "user"
-    
-    home_active = "active" if current_page == "feed" else ""
-    search_active = "active" if current_page == "search" else ""
-    add_active = "active" if current_page == "create" else ""
-    message_active = "active" if current_page == "direct" else ""
-    profile_active = "active" if current_page == "profile" else ""
-    
-    return f"""
-    <div class='bottom-nav'>
-        <a class='nav-icon {home_active}' href="/feed">{SVG_ICONS['home']}</a>
-        <a class='nav-icon {search_active}' href="/search">{SVG_ICONS['search']}</a>
-        <a class='nav-icon {add_active}' href="/create">{SVG_ICONS['add']}</a>
-        <a class='nav-icon {message_active}' href="/direct">{SVG_ICONS['message']}</a>
-        <a class='nav-icon {profile_active}' href="/profile/{username}">{SVG_ICONS['profile']}</a>
-    </div>
-    """
-
-
-# ================= AUTH ROUTES ===================
-
-@app.route("/")
-def home():
-    if "user" in session:
-        return redirect("/feed")
-    return render_template_string(momentum_css + """
-        <div class='welcome-container'>
-            <div class='welcome-title'>Momentum</div>
-            <div class='welcome-subtitle'>
-                Connect with friends and share your moments. Join our community today 
-                and start sharing your journey with the world.
-            </div>
-            
-            <form method="POST" action="/login">
-                <input class='form-input' name='username' placeholder='Username' required>
-                <input class='form-input' name='password' placeholder='Password' type='password' required>
-                <button class='btn' style='width:100%;'>Sign In</button>
-            </form>
-
-            <p style='margin-top:20px;'>
-                Don't have an account? <a href="/register">Sign Up</a>
-            </p>
-        </div>
-    """)
-
-
-@app.route("/login", methods=["POST"])
-def login():
-    username = request.form.get("username", "")
-    password = request.form.get("password", "")
-
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username=? AND password=?", (username, password))
-    user = c.fetchone()
-    conn.close()
-
-    if user:
-        session["user"] = tuple(user)
-        return redirect("/feed")
-    else:
-        return "Invalid username or password!"
-
-
-@app.route("/register")
-def register():
-    return render_template_string(momentum_css + """
-        <div class='app-container' style='padding-top: 20px;'>
-            <h2 style='text-align: center; margin-bottom: 30px;'>Create Your Account</h2>
-            <form method="POST" enctype="multipart/form-data" action="/register_now">
-                <input class='form-input' name='fullname' placeholder='Full Name' required>
-                <input class='form-input' name='username' placeholder='Username' required>
-                <input class='form-input' name='email' placeholder='Email' type='email' required>
-                <input class='form-input' name='password' type='password' placeholder='Password' required>
-                <input class='form-input' name='age' placeholder='Age' type='number' required>
-                <label style='font-weight: bold; display: block; margin-bottom: 8px;'>Profile Photo</label>
-                <input class='file-input' type='file' name='photo' accept='image/*' required>
-                <button class='btn' style='width:100%; margin-top: 20px;'>Sign Up</button>
-            </form>
-        </div>
-    """)
-
-
-@app.route("/register_now", methods=["POST"])
-def register_now():
-    fullname = request.form["fullname"]
-    username = request.form["username"]
-    email = request.form["email"]
-    password = request.form["password"]
-    age = request.form["age"]
-
-    file = request.files["photo"]
-    filename = secure_filename(file.filename)
-    file.save(os.path.join("static/photos", filename))
-
-    conn = get_db_conn()
-    c = conn.cursor()
-
-    try:
-        c.execute("""
-            INSERT INTO users(fullname, username, email, password, age, photo)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (fullname, username, email, password, age, filename))
-        conn.commit()
-    except:
-        conn.close()
-        return "Username or Email already taken."
-
-    conn.close()
-    return redirect("/")
-
-
-@app.route("/logout")
-def logout():
-    session.clear()
-    return redirect("/")
-
-# --- PART 2/7 END ---
-# --- PART 3/7 START ---
-
-# ================= FEED PAGE ====================
-
-@app.route("/feed")
-def feed():
-    if "user" not in session:
-        return redirect("/")
-
-    refresh_session_user()
-    user = session["user"]
-    uid = user[0] if isinstance(user, tuple) else user["id"]
-
-    conn = get_db_conn()
-    c = conn.cursor()
-
-    # Fetch posts from user + followed users
-    c.execute("""
-        SELECT p.*, u.username, u.photo AS user_photo
-        FROM posts p
-        JOIN users u ON p.user_id = u.id
-        WHERE p.user_id = ? OR p.user_id IN
-              (SELECT user_id FROM followers WHERE follower_id=?)
-        ORDER BY datetime(p.timestamp) DESC
-    """, (uid, uid))
-
-    posts = c.fetchall()
-    conn.close()
-
-    posts_html = ""
-
-    for p in posts:
-        like_count = get_like_count(p["id"])
-        comment_count = get_comment_count(p["id"])
-        is_liked_flag = is_liked(p["id"], uid)
-
-        like_icon = SVG_ICONS['heart'] if is_liked_flag else SVG_ICONS['heart_outline']
-
-        media_html = ""
-        if p["media_type"] == "image":
-            media_html = f"<img src='/static/posts/{p['media']}' style='width:100%; display: block;'>"
-        else:
-            media_html = f"<video src='/static/posts/{p['media']}' controls style='width:100%; display: block;'></video>"
-
-        posts_html += f"""
-        <div style='background:white; border:1px solid var(--border-gray); border-radius:12px; margin-bottom:20px; overflow: hidden;'>
-            <div style='display:flex; align-items:center; padding:12px;'>
-                <img src='/static/photos/{p['user_photo']}' style='width:40px;height:40px;border-radius:50%;margin-right:10px; object-fit: cover;'>
-                <b><a href='/profile/{p['username']}' style='color:black; text-decoration:none;'>{p['username']}</a></b>
-            </div>
-
-            {media_html}
-
-            <div style='padding:12px;'>
-
-                <div style='display:flex; gap:12px; font-size:22px;'>
-                    <a href='/like/{p["id"]}' style='text-decoration:none; color: {"#ed4956" if is_liked_flag else "black"};'>{like_icon}</a>
-                    <a href='/post/{p["id"]}/comments' style='text-decoration:none; color: black;'>{SVG_ICONS['comment']}</a>
-                </div>
-
-                <p style='margin-top:5px; font-weight:bold;'>{like_count} likes</p>
-
-                <p style='margin: 8px 0;'><b>{p['username']}</b> {p['caption']}</p>
-
-                <a href='/post/{p["id"]}/comments' style='color:gray; text-decoration: none;'>View all {comment_count} comments</a>
-            </div>
-        </div>
-        """
-
-    html = momentum_css + get_header(session["user"], "feed") + f"""
-        <div class='app-container'>
-            {posts_html if posts_html else "<h3 style='text-align: center; color: #666;'>No posts yet. Follow people to see their posts!</h3>"}
-        </div>
-        """ + get_bottom_nav(session["user"], "feed")
-
-    return render_template_string(html)
-
-
-
-# ================= CREATE POST ====================
-
-@app.route("/create")
-def create():
-    if "user" not in session:
-        return redirect("/")
-    return render_template_string(momentum_css + get_header(session["user"], "create") + """
-        <div class='app-container'>
-            <h2 style='text-align: center; margin-bottom: 30px;'>Create Post</h2>
-            <form method='POST' enctype="multipart/form-data" action='/create_now'>
-                <textarea class='form-input' name='caption' placeholder="Write a caption..." style='height: 100px; resize: vertical;'></textarea>
-                <label style='font-weight: bold; display: block; margin-bottom: 8px;'>Select Media</label>
-                <input class='file-input' type='file' name='media' accept='image/*,video/*' required>
-                <button class='btn' style='width:100%; margin-top: 20px;'>Share Post</button>
-            </form>
-        </div>
-        """ + get_bottom_nav(session["user"], "create"))
-
-
-@app.route("/create_now", methods=["POST"])
-def create_now():
-    if "user" not in session:
-        return redirect("/")
-
-    uid = session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"]
-    caption = request.form.get("caption", "")
-
-    file = request.files["media"]
-    filename = secure_filename(file.filename)
-    file.save(os.path.join("static/posts", filename))
-
-    media_type = detect_media_type(filename)
-    timestamp = datetime.datetime.now().isoformat()
-
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO posts(user_id, caption, media, media_type, timestamp)
-        VALUES (?, ?, ?, ?, ?)
-    """, (uid, caption, filename, media_type, timestamp))
-    conn.commit()
-    conn.close()
-
-    return redirect("/feed")
-
-
-
-# ================= LIKE SYSTEM ====================
-
-@app.route("/like/<pid>")
-def like(pid):
-    if "user" not in session:
-        return redirect("/")
-    uid = session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"]
-
-    conn = get_db_conn()
-    c = conn.cursor()
-
-    if is_liked(pid, uid):
-        c.execute("DELETE FROM likes WHERE post_id=? AND user_id=?", (pid, uid))
-    else:
-        c.execute("INSERT INTO likes(post_id, user_id) VALUES (?, ?)", (pid, uid))
-
-    conn.commit()
-    conn.close()
-    return redirect("/feed")
-
-
-
-# ================= COMMENT SYSTEM ====================
-
-@app.route("/comment/<pid>", methods=["POST"])
-def comment(pid):
-    if "user" not in session:
-        return redirect("/")
-    uid = session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"]
-    comment_text = request.form.get("comment", "").strip()
-
-    if comment_text:
-        ts = datetime.datetime.now().isoformat()
-        conn = get_db_conn()
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO comments(post_id, user_id, comment, timestamp)
-            VALUES (?, ?, ?, ?)
-        """, (pid, uid, comment_text, ts))
-        conn.commit()
-        conn.close()
-
-    return redirect(f"/post/{pid}/comments")
-
-
-# ================= VIEW SINGLE POST COMMENTS PAGE ===================
-
-@app.route("/post/<pid>/comments")
-def post_comments(pid):
-    if "user" not in session:
-        return redirect("/")
-
-    uid = session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"]
-
-    conn = get_db_conn()
-    c = conn.cursor()
-
-    # Fetch post
-    c.execute("""
-        SELECT p.*, u.username, u.photo AS user_photo
-        FROM posts p 
-        JOIN users u ON p.user_id = u.id
-        WHERE p.id=?
-    """, (pid,))
-    post = c.fetchone()
-
-    # Fetch comments
-    c.execute("""
-        SELECT c.*, u.username, u.photo AS user_photo
-        FROM comments c
-        JOIN users u ON c.user_id = u.id
-        WHERE c.post_id=?
-        ORDER BY datetime(c.timestamp)
-    """, (pid,))
-    comments = c.fetchall()
-
-    conn.close()
-
-    comments_html = ""
-    for cm in comments:
-        comments_html += f"""
-        <div style='display:flex; gap:10px; padding:12px 0; border-bottom:1px solid #eee;'>
-            <img src='/static/photos/{cm["user_photo"]}' style='width:36px;height:36px;border-radius:50%; object-fit: cover;'>
-            <div style='flex: 1;'>
-                <b>{cm["username"]}</b><br>
-                <span style='color: #333;'>{cm["comment"]}</span>
-            </div>
-        </div>
-        """
-
-    media_html = ""
-    if post["media_type"] == "image":
-        media_html = f"<img src='/static/posts/{post['media']}' style='width:100%; border-radius: 8px;'>"
-    else:
-        media_html = f"<video src='/static/posts/{post['media']}' controls style='width:100%; border-radius: 8px;'></video>"
-
-    html = momentum_css + get_header(session["user"]) + f"""
-        <div class='app-container'>
-            <div style="margin-bottom:20px;">
-                <div style='display:flex; align-items:center; gap:10px; margin-bottom: 15px;'>
-                    <img src='/static/photos/{post["user_photo"]}' style='width:40px;height:40px;border-radius:50%; object-fit: cover;'>
-                    <b>{post["username"]}</b>
-                </div>
-                <div style="margin-top:10px;">{media_html}</div>
-                <p style='margin: 12px 0;'><b>{post["username"]}</b> {post["caption"]}</p>
-            </div>
-
-            <h3 style='margin-bottom: 15px;'>Comments</h3>
-            <div style='max-height: 300px; overflow-y: auto;'>
-                {comments_html if comments_html else "<p style='text-align: center; color: #666;'>No comments yet</p>"}
-            </div>
-
-            <form method='POST' action='/comment/{pid}' style='margin-top:20px;'>
-                <input name='comment' class='form-input' placeholder='Write a comment...' style='margin-bottom: 10px;'>
-                <button class='btn' style='width: 100%;'>Post Comment</button>
-            </form>
-        </div>
-        """ + get_bottom_nav(session["user"])
-
-    return render_template_string(html)
-
-# --- PART 3/7 END ---
-# --- PART 4/7 START ---
-
-# =================== SEARCH PAGE =====================
-
-@app.route("/search", methods=["GET", "POST"])
-def search():
-    if "user" not in session:
-        return redirect("/")
-
-    query = ""
-
-    results_html = ""
-
-    if request.method == "POST":
-        query = request.form.get("query", "").strip()
-
-        conn = get_db_conn()
-        c = conn.cursor()
-        c.execute("""
-            SELECT * FROM users 
-            WHERE username LIKE ? OR fullname LIKE ?
-        """, (f"%{query}%", f"%{query}%"))
-        results = c.fetchall()
-        conn.close()
-
-        for u in results:
-            results_html += f"""
-            <a href='/profile/{u["username"]}' 
-               style='display:flex; gap:12px; padding:12px; border-bottom:1px solid #eee; text-decoration:none; color:black; align-items: center;'>
-                <img src='/static/photos/{u["photo"]}' 
-                    style='width:50px; height:50px; border-radius:50%; object-fit: cover;'>
-                <div>
-                    <b style='display: block; margin-bottom: 4px;'>{u["username"]}</b>
-                    <span style='color:gray; font-size:14px;'>{u["fullname"]}</span>
-                </div>
-            </a>
-            """
-
-    html = momentum_css + get_header(session["user"], "search") + f"""
-        <div class='app-container'>
-            <h2 style='margin-bottom: 20px;'>Search</h2>
-
-            <form method='POST'>
-                <input class='form-input' name='query' value='{query}' placeholder='Search users by username or name...'>
-            </form>
-
-            <div style='margin-top:20px; background: white; border-radius: 12px; overflow: hidden;'>
-                {results_html if results_html else "<p style='text-align: center; padding: 30px; color: #666;'>No users found. Try searching with different terms.</p>"}
-            </div>
-        </div>
-        """ + get_bottom_nav(session["user"], "search")
-
-    return render_template_string(html)
-
-
-
-# ================= FOLLOW USER =====================
-
-@app.route("/follow/<tid>")
-def follow(tid):
-    if "user" not in session:
-        return redirect("/")
-
-    uid = session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"]
-
-    conn = get_db_conn()
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO followers(user_id, follower_id) VALUES (?, ?)", (tid, uid))
-        conn.commit()
-    except:
-        pass
-
-    conn.close()
-
-    target = fetch_user_by_id(tid)
-    return redirect(f"/profile/{target['username']}")
-
-
-# ================= UNFOLLOW USER =====================
-
-@app.route("/unfollow/<tid>")
-def unfollow(tid):
-    if "user" not in session:
-        return redirect("/")
-
-    uid = session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"]
-
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("DELETE FROM followers WHERE user_id=? AND follower_id=?", (tid, uid))
-    conn.commit()
-    conn.close()
-
-    target = fetch_user_by_id(tid)
-    return redirect(f"/profile/{target['username']}")
-
-
-# ================= PROFILE PAGE =====================
-
-@app.route("/profile/<username>")
-def profile(username):
-    if "user" not in session:
-        return redirect("/")
-
-    viewer = session["user"]
-    viewer_id = viewer[0] if isinstance(viewer, tuple) else viewer["id"]
-
-    target = fetch_user_by_username(username)
-    if not target:
-        return "User not found."
-
-    target_id = target["id"]
-
-    # Follow Button Logic
-    if viewer_id != target_id:
-        if is_following(target_id, viewer_id):
-            follow_btn = f"<a href='/unfollow/{target_id}' class='btn-outline'>Unfollow</a>"
-        else:
-            follow_btn = f"<a href='/follow/{target_id}' class='btn'>Follow</a>"
-    else:
-        follow_btn = ""
-
-    # Post grid
-    posts = get_user_posts(target_id)
-    grid_html = ""
-    for p in posts:
-        if p["media_type"] == "image":
-            grid_html += f"""
-            <div class='post-grid-item'>
-                <a href='/post/{p["id"]}/comments'>
-                    <img src='/static/posts/{p["media"]}' alt='Post'>
-                </a>
-            </div>
-            """
-        else:
-            grid_html += f"""
-            <div class='post-grid-item'>
-                <a href='/post/{p["id"]}/comments'>
-                    <video src='/static/posts/{p["media"]}' style='object-fit: cover;'>
-                </a>
-            </div>
-            """
-
-    # FOLLOW / MESSAGE BUTTON + FULL NAME (Your request)
-    action_buttons = ""
-    if viewer_id != target_id:
-        action_buttons = f"""
-            <div style='display:flex; gap:12px; margin-top:10px;'>
-                {follow_btn}
-                <a href='/chat/{username}' class='btn' 
-                   style='background:#0095F6; color:white;'>Message</a>
-            </div>
-        """
-
-    html = momentum_css + get_header(session["user"], "profile") + f"""
-        <div class='app-container'>
-
-            <div style='display:flex; gap:20px; margin-top:20px; align-items:center;'>
-                <img src='/static/photos/{target["photo"]}' 
-                     style='width:90px; height:90px; border-radius:50%; object-fit:cover;'>
-
-                <div style='flex: 1;'>
-                    <h2 style='margin:0; padding:0; font-size: 24px;'>{target["fullname"]}</h2>
-                    <p style='margin: 5px 0; color: #666;'>@{target["username"]}</p>
-                    {action_buttons}
-                </div>
-            </div>
-
-            <div style='display:flex; gap:25px; margin-top:20px; text-align: center;'>
-                <div><b style='display: block; font-size: 18px;'>{len(posts)}</b><span style='color: #666;'>posts</span></div>
-                <div><b style='display: block; font-size: 18px;'>{followers_count(target_id)}</b><span style='color: #666;'>followers</span></div>
-                <div><b style='display: block; font-size: 18px;'>{following_count(target_id)}</b><span style='color: #666;'>following</span></div>
-            </div>
-
-            <hr style='margin:20px 0;'>
-
-            <div class='post-grid'>
-                {grid_html if grid_html else "<div style='grid-column: 1 / -1; text-align: center; padding: 40px; color: #666;'>No posts yet</div>"}
-            </div>
-
-        </div>
-        """ + get_bottom_nav(session["user"], "profile")
-
-    return render_template_string(html)
-
-# --- PART 4/7 END ---
-# --- PART 5/7 START ---
-
-# ================= DIRECT MESSAGE (INBOX) =====================
-
-@app.route("/direct")
-def direct():
-    if "user" not in session:
-        return redirect("/")
-
-    uid = session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"]
-
-    conn = get_db_conn()
-    c = conn.cursor()
-
-    # fetch all chat partners (unique)
-    c.execute("""
-        SELECT DISTINCT
-            CASE
-                WHEN sender_id = ? THEN receiver_id
-                ELSE sender_id
-            END AS chat_user
-        FROM messages
-        WHERE sender_id = ? OR receiver_id = ?
-    """, (uid, uid, uid))
-
-    rows = c.fetchall()
-    conn.close()
-
-    chat_list_html = ""
-
-    for r in rows:
-        partner = fetch_user_by_id(r["chat_user"])
-        chat_list_html += f"""
-        <a href='/chat/{partner["username"]}' 
-           style='display:flex; align-items:center; gap:12px; padding:15px;
-                  border-bottom:1px solid #eee; text-decoration:none; color:black;'>
-            <img src='/static/photos/{partner["photo"]}' 
-                 style='width:50px; height:50px; border-radius:50%; object-fit:cover;'>
-            <div>
-                <b style='display: block; margin-bottom: 4px;'>{partner["username"]}</b>
-                <span style='color:gray; font-size:14px;'>Tap to message</span>
-            </div>
-        </a>
-        """
-
-    html = momentum_css + get_header(session["user"], "direct") + f"""
-        <div class='app-container'>
-            <h2 style='margin-bottom: 20px;'>Messages</h2>
-            <div style='margin-top:20px; background: white; border-radius: 12px; overflow: hidden;'>
-                {chat_list_html if chat_list_html else "<p style='text-align: center; padding: 40px; color: #666;'>No messages yet. Start a conversation!</p>"}
-            </div>
-        </div>
-        """ + get_bottom_nav(session["user"], "direct")
-
-    return render_template_string(html)
-
-
-
-# ================= CHAT WINDOW =====================
-
-@app.route("/chat/<username>", methods=["GET", "POST"])
-def chat(username):
-    if "user" not in session:
-        return redirect("/")
-
-    sender_id = session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"]
-    receiver = fetch_user_by_username(username)
-
-    if not receiver:
-        return "User does not exist."
-
-    receiver_id = receiver["id"]
-
-    # SEND MESSAGE
-    if request.method == "POST":
-        msg = request.form.get("message", "").strip()
-        if msg:
-            ts = datetime.datetime.now().isoformat()
-            conn = get_db_conn()
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO messages(sender_id, receiver_id, message, timestamp)
-                VALUES (?, ?, ?, ?)
-            """, (sender_id, receiver_id, msg, ts))
-            conn.commit()
-            conn.close()
-
-        return redirect(f"/chat/{username}")
-
-    # FETCH CHAT HISTORY
-    conn = get_db_conn()
-    c = conn.cursor()
-
-    c.execute("""
-        SELECT m.*, u.username, u.photo AS user_photo
-        FROM messages m
-        JOIN users u ON m.sender_id = u.id
-        WHERE (sender_id=? AND receiver_id=?) OR 
-              (sender_id=? AND receiver_id=?)
-        ORDER BY datetime(timestamp)
-    """, (sender_id, receiver_id, receiver_id, sender_id))
-
-    msgs = c.fetchall()
-    conn.close()
-
-    # MESSAGE BUBBLES
-    msgs_html = ""
-    for m in msgs:
-        align = "right" if m["sender_id"] == sender_id else "left"
-        color = "#DCF8C6" if m["sender_id"] == sender_id else "#ffffff"
-
-        msgs_html += f"""
-        <div style='text-align:{align}; margin:8px 0;'>
-            <div style='display:inline-block; padding:12px 16px;
-                        background:{color};
-                        border-radius:18px;
-                        max-width:70%;
-                        font-size:14px;
-                        border:1px solid #e0e0e0;'>
-                <b style='font-size:12px; color: #666;'>{m["username"]}</b><br>
-                <span style='word-break: break-word;'>{m["message"]}</span>
-            </div>
-        </div>
-        """
-
-    html = momentum_css + get_header(session["user"]) + f"""
-        <div style="position: fixed; top: 60px; left: 0; right: 0; bottom: 60px; background: white; display: flex; flex-direction: column;">
-            <!-- CHAT HEADER -->
-            <div style="display: flex; align-items: center; gap: 12px; padding: 15px; border-bottom: 1px solid #eee; background: white;">
-                <img src='/static/photos/{receiver["photo"]}' 
-                     style='width:45px; height:45px; border-radius:50%; object-fit:cover;'>
-                <div>
-                    <b style='font-size: 16px;'>{receiver["username"]}</b><br>
-                    <span style='color:gray; font-size:12px;'>Active now</span>
-                </div>
-            </div>
-
-            <!-- CHAT MESSAGES -->
-            <div id='chatbox'
-                 style='flex: 1; padding: 15px; overflow-y: auto; background: #f8f8f8;'>
-                {msgs_html if msgs_html else '<div style="text-align: center; color: #666; padding: 40px;">No messages yet. Start the conversation!</div>'}
-            </div>
-
-            <!-- SEND FORM -->
-            <form method='POST' style='padding: 15px; border-top: 1px solid #eee; background: white; display: flex; gap: 10px; align-items: center;'>
-                <input name='message' style='flex: 1; padding: 12px 16px; border: 1px solid #ddd; border-radius: 24px; font-size: 16px;' 
-                       placeholder='Type a message...' autocomplete='off'>
-                <button class='btn' style='border-radius: 24px; padding: 12px 20px;'>Send</button>
-            </form>
-        </div>
-
-        <!-- AUTO SCROLL TO BOTTOM -->
-        <script>
-            var box = document.getElementById('chatbox');
-            box.scrollTop = box.scrollHeight;
-        </script>
-        """ + get_bottom_nav(session["user"])
-
-    return render_template_string(html)
-
-# --- PART 5/7 END ---
-# --- PART 6/7 START ---
-
-# ================= SETTINGS PAGE =====================
-
-@app.route("/settings")
-def settings():
-    if "user" not in session:
-        return redirect("/")
-
-    html = momentum_css + get_header(session["user"]) + """
-        <div class='app-container'>
-            <h2 style='text-align: center; margin-bottom: 30px;'>Settings</h2>
-
-            <a href='/edit_profile' class='btn' style='display:block; margin-top:15px; width:100%; text-align:center; padding: 15px;'>Edit Profile</a>
-            <a href='/change_password' class='btn-outline' style='display:block; margin-top:15px; width:100%; text-align:center; padding: 15px;'>Change Password</a>
-            <a href='/logout' class='btn-outline' style='display:block; margin-top:15px; color:red; border-color:red; width:100%; text-align:center; padding: 15px;'>Logout</a>
-        </div>
-        """ + get_bottom_nav(session["user"])
-
-    return render_template_string(html)
-
-
-# ================= EDIT PROFILE PAGE =====================
-
-@app.route("/edit_profile", methods=["GET", "POST"])
-def edit_profile():
-    if "user" not in session:
-        return redirect("/")
-
-    user = fetch_user_by_id(session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"])
-
-    if request.method == "POST":
-        fullname = request.form.get("fullname", user["fullname"])
-        email = request.form.get("email", user["email"])
-        age = request.form.get("age", user["age"])
-
-        photo_file = request.files.get("photo", None)
-        filename = user["photo"]
-        if photo_file and photo_file.filename:
-            filename = secure_filename(photo_file.filename)
-            photo_file.save(os.path.join("static/photos", filename))
-
-        conn = get_db_conn()
-        c = conn.cursor()
-        c.execute("""
-            UPDATE users 
-            SET fullname=?, email=?, age=?, photo=?
-            WHERE id=?
-        """, (fullname, email, age, filename, user["id"]))
-        conn.commit()
-        conn.close()
-
-        refresh_session_user()
-        return redirect(f"/profile/{user['username']}")
-
-    html = momentum_css + get_header(session["user"]) + f"""
-        <div class='app-container'>
-            <h2 style='text-align: center; margin-bottom: 30px;'>Edit Profile</h2>
-            <form method='POST' enctype='multipart/form-data'>
-                <label style='font-weight: bold; display: block; margin-bottom: 8px;'>Full Name</label>
-                <input class='form-input' name='fullname' value='{user["fullname"]}'>
-                <label style='font-weight: bold; display: block; margin-bottom: 8px;'>Email</label>
-                <input class='form-input' name='email' value='{user["email"]}'>
-                <label style='font-weight: bold; display: block; margin-bottom: 8px;'>Age</label>
-                <input class='form-input' name='age' value='{user["age"]}'>
-                <label style='font-weight: bold; display: block; margin-bottom: 8px;'>Profile Photo</label>
-                <input class='file-input' type='file' name='photo' accept='image/*'>
-                <button class='btn' style='width:100%; margin-top: 20px;'>Save Changes</button>
-            </form>
-        </div>
-        """ + get_bottom_nav(session["user"])
-    return render_template_string(html)
-
-
-# ================= CHANGE PASSWORD =====================
-
-@app.route("/change_password", methods=["GET", "POST"])
-def change_password():
-    if "user" not in session:
-        return redirect("/")
-
-    user = fetch_user_by_id(session["user"][0] if isinstance(session["user"], tuple) else session["user"]["id"])
-
-    if request.method == "POST":
-        old = request.form.get("old_password", "")
-        new = request.form.get("new_password", "")
-
-        if old != user["password"]:
-            return "Old password incorrect!"
-
-        conn = get_db_conn()
-        c = conn.cursor()
-        c.execute("UPDATE users SET password=? WHERE id=?", (new, user["id"]))
-        conn.commit()
-        conn.close()
-
-        refresh_session_user()
-        return redirect("/settings")
-
-    html = momentum_css + get_header(session["user"]) + """
-        <div class='app-container'>
-            <h2 style='text-align: center; margin-bottom: 30px;'>Change Password</h2>
-            <form method='POST'>
-                <label style='font-weight: bold; display: block; margin-bottom: 8px;'>Old Password</label>
-                <input class='form-input' type='password' name='old_password'>
-                <label style='font-weight: bold; display: block; margin-bottom: 8px;'>New Password</label>
-                <input class='form-input' type='password' name='new_password'>
-                <button class='btn' style='width:100%; margin-top: 20px;'>Change Password</button>
-            </form>
-        </div>
-        """ + get_bottom_nav(session["user"])
-    return render_template_string(html)
-
-# --- PART 6/7 END ---
-# --- PART 7/7 START ---
-
-# ========== ROOT REDIRECT ==========
-@app.route("/home")
-def goto_home():
-    return redirect("/feed")
-
-
-# ========== FLASK RUNNER ==========
-
-if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
-
+# -*- coding: utf-8 -*-
+# --- PART 1/7 START ---
+
+#!/usr/bin/env python3
+from flask import (Flask, Blueprint, Request, request, redirect, session, render_template, g, abort,
+                   jsonify, has_app_context, has_request_context, current_app,
+                   before_render_template, template_rendered,
+                   send_from_directory, make_response, get_template_attribute)
+from markupsafe import Markup
+import sqlite3, os, datetime, time, base64, hashlib, gzip, queue, threading, shutil, subprocess, tempfile
+import mimetypes, bisect, secrets, hmac, logging
+from collections import OrderedDict
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+# Routes, hooks and CLI commands hang off this blueprint; create_app()
+# (at the bottom) builds the Flask app around it. Importing the module
+# does no I/O beyond fingerprinting the static assets.
+bp = Blueprint("mom", __name__, cli_group=None)
+logger = logging.getLogger(__name__)
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# -------------- MEDIA STORE --------------
+# Uploaded files are stored once per distinct content, named by their
+# SHA-256 and sharded two levels deep (media/ab/cd/abcd...jpg), with any
+# resized variants next to them. A name never changes meaning, so /media/
+# URLs are cached forever. The media table counts the posts and profiles
+# using each file; `flask media-gc` deletes what nothing uses.
+MEDIA_ROOT = "media"
+HASH_CHUNK = 1024 * 1024
+
+
+def media_path(name):
+    return os.path.join(MEDIA_ROOT, name)
+
+
+def media_ext(filename):
+    return os.path.splitext(secure_filename(filename))[1].lower()
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def add_media_file(src, ext, digest=None, move=False):
+    # Returns the stored name. Content already in the store is reused, and
+    # touched so the collector's grace period restarts for the new user.
+    digest = digest or file_digest(src)
+    name = f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+    dest = media_path(name)
+    if os.path.exists(dest):
+        os.utime(dest)
+        if move:
+            os.remove(src)
+        return name
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if move:
+        os.replace(src, dest)
+    else:
+        shutil.copyfile(src, dest + ".tmp")
+        os.replace(dest + ".tmp", dest)
+    os.chmod(dest, 0o644)
+    return name
+
+
+# -------------- UPLOADS --------------
+# Request bodies are spooled straight into named files and hashed as they
+# are written, so storing an upload is a rename rather than another pass
+# over the bytes. The folder must sit on the same filesystem as MEDIA_ROOT.
+UPLOAD_TMP = "uploads"
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_VIDEO_BYTES = 500 * 1024 * 1024
+
+
+class SpooledUpload:
+    def __init__(self):
+        self.file = tempfile.NamedTemporaryFile("wb+", dir=UPLOAD_TMP, delete=False)
+        self.name = self.file.name
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, attr):
+        return getattr(self.file, attr)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return SpooledUpload()
+
+
+# -------------- METRICS --------------
+# Off unless the METRICS setting is on (MOM_METRICS=true). Then connections
+# are opened with a cursor class that times every statement, and request
+# hooks record per-route latency, statement counts and time, connection
+# opens and template render time, served in Prometheus text format at
+# /metrics. Statements slower than SLOW_QUERY_MS are logged with their
+# parameters redacted. When off, connections are plain sqlite3 ones and
+# the hooks return straight away. Numbers are per worker process; keep
+# /metrics off the public proxy.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+METRIC_HELP = {
+    "mom_request_duration_seconds": ("histogram", "Request latency, from session load to teardown."),
+    "mom_requests_total": ("counter", "Requests by route and status."),
+    "mom_request_queries": ("histogram", "SQL statements run per request."),
+    "mom_db_queries_total": ("counter", "SQL statements run."),
+    "mom_db_query_seconds_total": ("counter", "Time spent executing SQL statements."),
+    "mom_db_connections_total": ("counter", "Database connections opened."),
+    "mom_slow_queries_total": ("counter", "Statements slower than SLOW_QUERY_MS."),
+    "mom_template_render_seconds": ("histogram", "Template render time."),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.slow_query = 0.1       # seconds
+        self._lock = threading.Lock()
+        self._series = {}           # (name, labels) -> number or Histogram
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._series[name, labels] = self._series.get((name, labels), 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            histogram = self._series.get((name, labels))
+            if histogram is None:
+                histogram = self._series[name, labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        def fmt(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in labels) + "}"
+
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0])
+            lines = []
+            for name, (kind, text) in METRIC_HELP.items():
+                lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+                for (series_name, labels), value in series:
+                    if series_name != name:
+                        continue
+                    if kind != "histogram":
+                        lines.append(f"{name}{fmt(labels)} {value}")
+                        continue
+                    total = 0
+                    for bound, n in zip(value.buckets + ("+Inf",), value.counts):
+                        total += n
+                        lines.append(f"{name}_bucket{fmt(labels + (('le', bound),))} {total}")
+                    lines.append(f"{name}_sum{fmt(labels)} {value.sum}")
+                    lines.append(f"{name}_count{fmt(labels)} {total}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def request_stats():
+    # Per-request totals, started by whatever touches them first (normally
+    # start_request_metrics) and counted against the route at teardown
+    stats = g.get("request_stats")
+    if stats is None:
+        stats = g.request_stats = {"start": time.perf_counter(), "status": 500, "queries": 0,
+                                   "query_time": 0.0, "slow": 0, "connections": 0}
+    return stats
+
+
+def metrics_route():
+    return request.url_rule.rule if request.url_rule else "<unmatched>"
+
+
+def redact(params):
+    # Types only: values may be passwords, messages or session ids
+    if params is None:
+        return "(many)"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+
+
+def record_query(sql, params, elapsed):
+    slow = elapsed >= metrics.slow_query
+    if has_request_context():
+        stats = request_stats()
+        stats["queries"] += 1
+        stats["query_time"] += elapsed
+        stats["slow"] += slow
+        where = request.path
+    else:
+        background = (("route", "background"),)
+        metrics.inc("mom_db_queries_total", background)
+        metrics.inc("mom_db_query_seconds_total", background, elapsed)
+        metrics.inc("mom_slow_queries_total", background, slow)
+        where = "background"
+    if slow:
+        logger.warning("Slow query (%.0f ms) on %s: %s %s", elapsed * 1000, where,
+                       " ".join(sql.split()), redact(params))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times to the first row; fetching the rest is not included
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            record_query(sql, params, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            record_query(sql, None, time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if has_request_context():
+            request_stats()["connections"] += 1
+        else:
+            metrics.inc("mom_db_connections_total", (("route", "background"),))
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+@bp.before_app_request
+def start_request_metrics():
+    if metrics.enabled:
+        request_stats()
+
+
+@bp.after_app_request
+def note_response_status(response):
+    if metrics.enabled:
+        request_stats()["status"] = response.status_code
+    return response
+
+
+@bp.teardown_app_request
+def record_request_metrics(exc):
+    # After the session is saved, so its statements count too
+    stats = g.get("request_stats") if metrics.enabled else None
+    if stats is None:
+        return
+    route = (("route", metrics_route()),)
+    metrics.observe("mom_request_duration_seconds", route, time.perf_counter() - stats["start"])
+    metrics.observe("mom_request_queries", route, stats["queries"], QUERY_COUNT_BUCKETS)
+    metrics.inc("mom_requests_total", route + (("status", stats["status"]),))
+    metrics.inc("mom_db_queries_total", route, stats["queries"])
+    metrics.inc("mom_db_query_seconds_total", route, stats["query_time"])
+    metrics.inc("mom_slow_queries_total", route, stats["slow"])
+    metrics.inc("mom_db_connections_total", route, stats["connections"])
+
+
+def start_render_timer(app, template, context, **extra):
+    request_stats().setdefault("renders", {})[template.name] = time.perf_counter()
+
+
+def record_render(app, template, context, **extra):
+    start = request_stats().get("renders", {}).pop(template.name, None)
+    if start is not None:
+        metrics.observe("mom_template_render_seconds", (("template", template.name),),
+                        time.perf_counter() - start)
+
+
+@bp.route("/metrics")
+def metrics_endpoint():
+    if not metrics.enabled:
+        abort(404)
+    return current_app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+DB_PATH = "users.db"
+DB_BUSY_TIMEOUT = 10        # seconds a writer waits on a locked database
+DB_CACHE_SIZE_KB = 16000    # page cache per connection
+
+# -------------- DB CONNECTION --------------
+def connect_db():
+    factory = InstrumentedConnection if metrics.enabled else sqlite3.Connection
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT, factory=factory)
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers run alongside a writer; with it, synchronous=NORMAL
+    # is still crash-safe and skips an fsync on every commit.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    return conn
+
+
+def get_db_conn():
+    # One connection per request, shared by every helper it calls and
+    # closed in close_db_conn() when the app context is torn down.
+    if "db" not in g:
+        g.db = connect_db()
+    return g.db
+
+
+def close_db_conn(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        conn.close()
+
+
+# -------------- MIGRATIONS --------------
+# Each migration moves the schema up one version and PRAGMA user_version
+# records how many have run. Only ever append to MIGRATIONS; a step that has
+# shipped must not change, because existing databases have already run it.
+
+def migration_base_tables(c):
+    # USERS TABLE
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS users(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fullname TEXT,
+        username TEXT UNIQUE,
+        email TEXT UNIQUE,
+        password TEXT,
+        age TEXT,
+        photo TEXT
+    );
+    """)
+
+    # FOLLOWERS TABLE
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS followers(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        follower_id INTEGER,
+        UNIQUE(user_id, follower_id)
+    );
+    """)
+
+    # POSTS TABLE
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS posts(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        caption TEXT,
+        media TEXT,
+        media_type TEXT,
+        timestamp TEXT
+    );
+    """)
+
+    # LIKES TABLE
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS likes(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER,
+        user_id INTEGER,
+        UNIQUE(post_id, user_id)
+    );
+    """)
+
+    # COMMENTS TABLE
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS comments(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER,
+        user_id INTEGER,
+        comment TEXT,
+        timestamp TEXT
+    );
+    """)
+
+    # MESSAGES TABLE — CHAT SYSTEM
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS messages(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_id INTEGER,
+        receiver_id INTEGER,
+        message TEXT,
+        timestamp TEXT
+    );
+    """)
+
+
+def migration_drop_users_height(c):
+    # Databases from before the height field was removed still carry it
+    c.execute("PRAGMA table_info(users)")
+    columns = [col[1] for col in c.fetchall()]
+    if 'height' not in columns:
+        return
+
+    c.execute("""
+    CREATE TABLE users_new(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fullname TEXT,
+        username TEXT UNIQUE,
+        email TEXT UNIQUE,
+        password TEXT,
+        age TEXT,
+        photo TEXT
+    );
+    """)
+    c.execute("""
+    INSERT INTO users_new (id, fullname, username, email, password, age, photo)
+    SELECT id, fullname, username, email, password, age, photo FROM users
+    """)
+    c.execute("DROP TABLE users")
+    c.execute("ALTER TABLE users_new RENAME TO users")
+
+
+def migration_hot_path_indexes(c):
+    # followers(user_id, follower_id) and likes(post_id, user_id) are
+    # already covered by their UNIQUE constraints.
+    # following_count + the feed's "who do I follow" subquery
+    c.execute("CREATE INDEX IF NOT EXISTS idx_followers_follower ON followers(follower_id, user_id)")
+    # profile grid
+    c.execute("CREATE INDEX IF NOT EXISTS idx_posts_user ON posts(user_id, timestamp)")
+    # comment counts + comments page
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comments_post ON comments(post_id, timestamp)")
+    # chat history + inbox, one index per side of the OR
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender_id, receiver_id, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_receiver ON messages(receiver_id, sender_id, timestamp)")
+
+
+def migration_integer_timestamps(c):
+    # ORDER BY datetime(timestamp) can't use an index, so listings sort on
+    # an integer epoch column instead. The ISO text column stays as the
+    # human-readable copy. Old rows were written in server-local time.
+    for table in ("posts", "comments", "messages"):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN ts INTEGER NOT NULL DEFAULT 0")
+        c.execute(f"""
+            UPDATE {table}
+            SET ts = COALESCE(CAST(strftime('%s', timestamp, 'utc') AS INTEGER), 0)
+        """)
+
+    c.execute("DROP INDEX IF EXISTS idx_posts_user")
+    c.execute("DROP INDEX IF EXISTS idx_comments_post")
+    c.execute("DROP INDEX IF EXISTS idx_messages_sender")
+    c.execute("DROP INDEX IF EXISTS idx_messages_receiver")
+    c.execute("CREATE INDEX idx_posts_user_ts ON posts(user_id, ts, id)")
+    c.execute("CREATE INDEX idx_comments_post_ts ON comments(post_id, ts, id)")
+    c.execute("CREATE INDEX idx_messages_sender_ts ON messages(sender_id, receiver_id, ts, id)")
+    c.execute("CREATE INDEX idx_messages_receiver_ts ON messages(receiver_id, sender_id, ts, id)")
+
+
+def recount_counters(c):
+    # Rebuild every denormalized counter from the source tables
+    c.execute("""
+        UPDATE users SET
+            followers_count = (SELECT COUNT(*) FROM followers WHERE user_id = users.id),
+            following_count = (SELECT COUNT(*) FROM followers WHERE follower_id = users.id),
+            posts_count = (SELECT COUNT(*) FROM posts WHERE user_id = users.id)
+    """)
+    c.execute("""
+        UPDATE posts SET
+            like_count = (SELECT COUNT(*) FROM likes WHERE post_id = posts.id),
+            comment_count = (SELECT COUNT(*) FROM comments WHERE post_id = posts.id)
+    """)
+
+
+def migration_counters(c):
+    # Counts shown on every page are kept as columns and maintained by
+    # triggers, so any write path (routes, scripts, the sqlite3 shell)
+    # keeps them in step. recount_counters() repairs drift.
+    for column in ("followers_count", "following_count", "posts_count"):
+        c.execute(f"ALTER TABLE users ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    for column in ("like_count", "comment_count"):
+        c.execute(f"ALTER TABLE posts ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+
+    for table, sql in (
+        ("followers", """
+            UPDATE users SET followers_count = followers_count {op} 1 WHERE id = {row}.user_id;
+            UPDATE users SET following_count = following_count {op} 1 WHERE id = {row}.follower_id;
+        """),
+        ("posts", """
+            UPDATE users SET posts_count = posts_count {op} 1 WHERE id = {row}.user_id;
+        """),
+        ("likes", """
+            UPDATE posts SET like_count = like_count {op} 1 WHERE id = {row}.post_id;
+        """),
+        ("comments", """
+            UPDATE posts SET comment_count = comment_count {op} 1 WHERE id = {row}.post_id;
+        """),
+    ):
+        c.execute(f"""
+            CREATE TRIGGER trg_{table}_insert AFTER INSERT ON {table}
+            BEGIN {sql.format(op="+", row="NEW")} END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER trg_{table}_delete AFTER DELETE ON {table}
+            BEGIN {sql.format(op="-", row="OLD")} END
+        """)
+
+    recount_counters(c)
+
+
+# Accounts with at least this many followers stop fanning out on write and
+# are merged into their followers' feeds at read time instead.
+FANOUT_LIMIT = 5000
+# How many of an account's recent posts a new follower gets copied in
+TIMELINE_BACKFILL = 200
+
+
+def migration_timeline(c):
+    # Materialized feeds: one row per (reader, post). celebrity is sticky
+    # once set, so a post is never lost between the two feed sources.
+    c.execute("ALTER TABLE users ADD COLUMN celebrity INTEGER NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX idx_users_celebrity ON users(id) WHERE celebrity = 1")
+    c.execute("""
+    CREATE TABLE timeline(
+        user_id INTEGER NOT NULL,
+        post_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        PRIMARY KEY (user_id, ts, post_id)
+    ) WITHOUT ROWID;
+    """)
+    c.execute("CREATE INDEX idx_timeline_author ON timeline(user_id, author_id)")
+
+    c.execute("UPDATE users SET celebrity = 1 WHERE followers_count >= ?", (FANOUT_LIMIT,))
+    c.execute("""
+        INSERT OR IGNORE INTO timeline(user_id, post_id, author_id, ts)
+        SELECT user_id, id, user_id, ts FROM posts
+    """)
+    c.execute("""
+        INSERT OR IGNORE INTO timeline(user_id, post_id, author_id, ts)
+        SELECT f.follower_id, p.id, p.user_id, p.ts
+        FROM posts p
+        JOIN followers f ON f.user_id = p.user_id
+        JOIN users u ON u.id = p.user_id
+        WHERE u.celebrity = 0
+    """)
+
+
+def migration_inbox(c):
+    # One row per (owner, chat partner) holding the latest message and the
+    # owner's unread count, kept current by a trigger on messages. Late
+    # inserts with an older ts never move a conversation backwards.
+    c.execute("""
+    CREATE TABLE inbox(
+        user_id INTEGER NOT NULL,
+        partner_id INTEGER NOT NULL,
+        last_message_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        unread INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, partner_id)
+    ) WITHOUT ROWID;
+    """)
+    c.execute("CREATE INDEX idx_inbox_recent ON inbox(user_id, ts, partner_id)")
+
+    upsert = """
+        INSERT INTO inbox(user_id, partner_id, last_message_id, ts, unread)
+        SELECT {owner}, {partner}, NEW.id, NEW.ts, {unread} WHERE {where}
+        ON CONFLICT(user_id, partner_id) DO UPDATE SET
+            last_message_id = CASE WHEN excluded.ts >= ts
+                                   THEN excluded.last_message_id ELSE last_message_id END,
+            ts = MAX(ts, excluded.ts),
+            unread = unread + excluded.unread;
+    """
+    c.execute(f"""
+        CREATE TRIGGER trg_messages_inbox AFTER INSERT ON messages
+        BEGIN
+            {upsert.format(owner="NEW.sender_id", partner="NEW.receiver_id", unread=0, where=1)}
+            {upsert.format(owner="NEW.receiver_id", partner="NEW.sender_id", unread=1,
+                           where="NEW.receiver_id != NEW.sender_id")}
+        END
+    """)
+
+    c.execute("""
+        INSERT INTO inbox(user_id, partner_id, last_message_id, ts)
+        SELECT owner, partner, id, ts FROM (
+            SELECT owner, partner, id, ts,
+                   ROW_NUMBER() OVER (PARTITION BY owner, partner
+                                      ORDER BY ts DESC, id DESC) AS n
+            FROM (
+                SELECT sender_id AS owner, receiver_id AS partner, id, ts FROM messages
+                UNION ALL
+                SELECT receiver_id, sender_id, id, ts FROM messages
+                WHERE receiver_id != sender_id
+            )
+        )
+        WHERE n = 1
+    """)
+
+
+# A conversation is keyed by its two participants, smaller id first, packed
+# into one integer so chat history is a single index range.
+CONVERSATION_KEY_SQL = "((MIN({a}, {b}) << 32) | MAX({a}, {b}))"
+
+
+def conversation_key(a, b):
+    return (min(a, b) << 32) | max(a, b)
+
+
+def migration_conversations(c):
+    # Inserts that leave conversation_id unset (scripts, the sqlite3 shell)
+    # get it filled in by trigger, like the counters.
+    c.execute("ALTER TABLE messages ADD COLUMN conversation_id INTEGER NOT NULL DEFAULT 0")
+    c.execute(f"""
+        UPDATE messages
+        SET conversation_id = {CONVERSATION_KEY_SQL.format(a="sender_id", b="receiver_id")}
+    """)
+    c.execute(f"""
+        CREATE TRIGGER trg_messages_conversation AFTER INSERT ON messages
+        WHEN NEW.conversation_id = 0
+        BEGIN
+            UPDATE messages
+            SET conversation_id = {CONVERSATION_KEY_SQL.format(a="NEW.sender_id", b="NEW.receiver_id")}
+            WHERE id = NEW.id;
+        END
+    """)
+    c.execute("DROP INDEX IF EXISTS idx_messages_sender_ts")
+    c.execute("DROP INDEX IF EXISTS idx_messages_receiver_ts")
+    c.execute("CREATE INDEX idx_messages_conversation_ts ON messages(conversation_id, ts, id)")
+
+    # Last message each side has seen; drives read receipts
+    c.execute("ALTER TABLE inbox ADD COLUMN last_read_id INTEGER NOT NULL DEFAULT 0")
+    c.execute("UPDATE inbox SET last_read_id = last_message_id WHERE unread = 0")
+
+
+def migration_media_variants(c):
+    # Posts start unready while their variants are made; existing ones are
+    # ready and fall back to the original until `flask thumbnails` runs.
+    c.execute("ALTER TABLE posts ADD COLUMN ready INTEGER NOT NULL DEFAULT 1")
+    c.execute("ALTER TABLE posts ADD COLUMN thumb TEXT")
+    c.execute("ALTER TABLE posts ADD COLUMN preview TEXT")
+    c.execute("CREATE INDEX idx_posts_pending ON posts(user_id) WHERE ready = 0")
+
+
+def migration_media_store(c):
+    # Existing uploads are copied into the store (the old folders are left
+    # alone) and rows re-pointed; variants are remade by `flask thumbnails`.
+    c.execute("""
+    CREATE TABLE media(
+        name TEXT PRIMARY KEY,
+        refs INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    """)
+    for table, column, folder in (("posts", "media", "static/posts"),
+                                  ("users", "photo", "static/photos")):
+        c.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")
+        for (old,) in c.fetchall():
+            src = os.path.join(folder, old)
+            if os.path.isfile(src):
+                c.execute(f"UPDATE {table} SET {column}=? WHERE {column}=?",
+                          (add_media_file(src, media_ext(old)), old))
+    c.execute("UPDATE posts SET thumb = NULL, preview = NULL")
+    recount_media(c)
+
+    add = """
+        INSERT INTO media(name, refs) SELECT {v}, 1 WHERE {v} IS NOT NULL
+        ON CONFLICT(name) DO UPDATE SET refs = refs + 1;
+    """
+    drop = "UPDATE media SET refs = refs - 1 WHERE name = {v};"
+    for table, column in (("posts", "media"), ("users", "photo")):
+        c.execute(f"""
+            CREATE TRIGGER trg_{table}_{column}_insert AFTER INSERT ON {table}
+            BEGIN {add.format(v=f"NEW.{column}")} END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER trg_{table}_{column}_delete AFTER DELETE ON {table}
+            BEGIN {drop.format(v=f"OLD.{column}")} END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER trg_{table}_{column}_update AFTER UPDATE OF {column} ON {table}
+            WHEN OLD.{column} IS NOT NEW.{column}
+            BEGIN {add.format(v=f"NEW.{column}")} {drop.format(v=f"OLD.{column}")} END
+        """)
+
+
+def recount_media(c):
+    c.execute("DELETE FROM media")
+    c.execute("""
+        INSERT INTO media(name, refs)
+        SELECT name, COUNT(*) FROM (
+            SELECT media AS name FROM posts WHERE media IS NOT NULL
+            UNION ALL
+            SELECT photo FROM users WHERE photo IS NOT NULL
+        )
+        GROUP BY name
+    """)
+
+
+def migration_user_search(c):
+    # Trigram full-text index over username and fullname, so substring
+    # search no longer scans users. It reads its text from users
+    # (external content) and triggers keep it in step with every write.
+    c.execute("""
+        CREATE VIRTUAL TABLE users_fts USING fts5(
+            username, fullname, content='users', content_rowid='id', tokenize='trigram'
+        )
+    """)
+    add = "INSERT INTO users_fts(rowid, username, fullname) VALUES (NEW.id, NEW.username, NEW.fullname);"
+    drop = """
+        INSERT INTO users_fts(users_fts, rowid, username, fullname)
+        VALUES ('delete', OLD.id, OLD.username, OLD.fullname);
+    """
+    c.execute(f"CREATE TRIGGER trg_users_fts_insert AFTER INSERT ON users BEGIN {add} END")
+    c.execute(f"CREATE TRIGGER trg_users_fts_delete AFTER DELETE ON users BEGIN {drop} END")
+    c.execute(f"""
+        CREATE TRIGGER trg_users_fts_update AFTER UPDATE OF username, fullname ON users
+        BEGIN {drop} {add} END
+    """)
+    c.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+def migration_sessions(c):
+    # Server-side sessions: the cookie only carries the id of a row here
+    c.execute("""
+        CREATE TABLE sessions(
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX idx_sessions_expires ON sessions(expires)")
+
+
+def migration_post_versions(c):
+    # Bumped whenever something a post card shows changes (likes and
+    # comments through their counter triggers, captions, media variants),
+    # so a rendered card can be cached under (id, version)
+    c.execute("ALTER TABLE posts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    columns = ("caption", "media", "preview", "like_count", "comment_count")
+    changed = " OR ".join(f"OLD.{col} IS NOT NEW.{col}" for col in columns)
+    c.execute(f"""
+        CREATE TRIGGER trg_posts_version AFTER UPDATE OF {", ".join(columns)} ON posts
+        WHEN {changed}
+        BEGIN UPDATE posts SET version = version + 1 WHERE id = NEW.id; END
+    """)
+
+
+def migration_username_nocase(c):
+    # Short searches match a username prefix in any case, as LIKE did
+    c.execute("CREATE INDEX idx_users_username_nocase ON users(username COLLATE NOCASE)")
+
+
+def migration_user_index_seq(c):
+    # Stamped with a new, larger number whenever a user is added or their
+    # username, name or photo changes, so each process's typeahead index
+    # can pick up what other processes wrote since it last looked
+    c.execute("ALTER TABLE users ADD COLUMN index_seq INTEGER NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX idx_users_index_seq ON users(index_seq)")
+    stamp = "UPDATE users SET index_seq = (SELECT MAX(index_seq) FROM users) + 1 WHERE id = NEW.id;"
+    c.execute(f"CREATE TRIGGER trg_users_index_seq_insert AFTER INSERT ON users BEGIN {stamp} END")
+    c.execute(f"""
+        CREATE TRIGGER trg_users_index_seq_update AFTER UPDATE OF username, fullname, photo ON users
+        WHEN OLD.username IS NOT NEW.username OR OLD.fullname IS NOT NEW.fullname
+             OR OLD.photo IS NOT NEW.photo
+        BEGIN {stamp} END
+    """)
+
+
+MIGRATIONS = [
+    migration_base_tables,
+    migration_drop_users_height,
+    migration_hot_path_indexes,
+    migration_integer_timestamps,
+    migration_counters,
+    migration_timeline,
+    migration_inbox,
+    migration_conversations,
+    migration_media_variants,
+    migration_media_store,
+    migration_user_search,
+    migration_sessions,
+    migration_post_versions,
+    migration_username_nocase,
+    migration_user_index_seq,
+]
+
+
+# -------------- INIT DATABASE --------------
+def init_db():
+    conn = connect_db()
+    c = conn.cursor()
+
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    for number, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+        # Each step commits together with its version bump, so a crash
+        # part-way through leaves the database at the last complete version.
+        c.execute("BEGIN")
+        migrate(c)
+        c.execute(f"PRAGMA user_version={number}")
+        conn.commit()
+
+    conn.close()
+
+
+def schema_version():
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version
+
+
+@bp.cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations."""
+    before = schema_version()
+    init_db()
+    print(f"Schema at version {len(MIGRATIONS)} ({len(MIGRATIONS) - before} applied).")
+
+
+@bp.cli.command("recount")
+def recount_command():
+    """Rebuild follower, following, post, like, comment and media counters."""
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("BEGIN")
+    recount_counters(c)
+    recount_media(c)
+    conn.commit()
+    conn.close()
+    print("Counters rebuilt.")
+
+
+# A post still unready this long after upload lost its media_pool job to a
+# restart; younger ones may still be in a worker's queue
+MEDIA_PENDING_GRACE = 600
+
+
+@bp.cli.command("thumbnails")
+def thumbnails_command():
+    """Finish posts whose processing was lost and make missing variants."""
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT id, media, media_type FROM posts WHERE ready = 0 AND ts < ?",
+              (int(time.time()) - MEDIA_PENDING_GRACE,))
+    pending = c.fetchall()
+    c.execute("SELECT id, media, media_type FROM posts WHERE thumb IS NULL AND ready = 1")
+    rows = pending + c.fetchall()
+    conn.close()
+    for row in rows:
+        process_post_media(row["id"], row["media"], row["media_type"])
+    print(f"Processed {len(rows)} posts ({len(pending)} left unready by a restart).")
+
+
+# Files younger than this are never collected: an upload is stored a moment
+# before the row that references it is committed
+MEDIA_GC_GRACE = 3600
+
+
+@bp.cli.command("media-gc")
+def media_gc_command():
+    """Delete stored media files that no post or profile uses."""
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT name FROM media WHERE refs > 0")
+    live = {os.path.splitext(r["name"])[0] for r in c.fetchall()}
+
+    # Variants (<hash>_320.jpg, ...) live and die with their original
+    cutoff = time.time() - MEDIA_GC_GRACE
+    removed = 0
+    for root, _, files in os.walk(MEDIA_ROOT):
+        for f in files:
+            path = os.path.join(root, f)
+            name = os.path.relpath(path, MEDIA_ROOT).replace(os.sep, "/")
+            stem = os.path.splitext(name)[0].split("_")[0]
+            if stem not in live and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+
+    c.execute("DELETE FROM media WHERE refs <= 0")
+    conn.commit()
+    conn.close()
+    print(f"Removed {removed} files.")
+
+# ----------- SESSIONS -----------
+# The cookie holds nothing but a random session id; what the session
+# contains (in practice just user_id) lives in a SessionStore on the
+# server. A store needs load(sid) -> (data, expires) or None,
+# save(sid, data, expires) and delete(sid). The row is read on the first
+# use of the session, so routes that never look at it (media, assets) cost
+# no database work, and rewritten only when the session changes or is a day
+# into its lifetime.
+SESSION_ID_BYTES = 32
+SESSION_REFRESH = 24 * 3600     # seconds between expiry extensions
+SESSION_PURGE_EVERY = 3600      # seconds between sweeps of expired rows
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, sid=None, load_row=None):
+        # load_row() -> (data, expires) or None, called on first use
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(None, on_update)
+        self.sid = sid
+        self.expires = None
+        self.new = True
+        self.modified = False
+        self.loaded = False
+        # SessionMixin.accessed is always True before Flask 3.1.3; tracked
+        # here instead, as any use of the data loads it
+        self.accessed = False
+        self.old_sid = None
+        self._load_row = load_row
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        self.accessed = True
+        row = self._load_row() if self._load_row else None
+        if row is None:
+            # No cookie, or its session is gone: start a new one
+            self.sid = new_session_id()
+            return
+        data, self.expires = row
+        dict.update(self, data)
+        self.new = False
+
+    def rotate(self):
+        # New id for the same data; the old row is deleted on save
+        self.load()
+        if not self.new:
+            self.old_sid = self.old_sid or self.sid
+        self.sid = new_session_id()
+        self.new = True
+        self.modified = True
+
+
+def _load_first(method):
+    def wrapper(self, *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+for _name in ("__getitem__", "__setitem__", "__delitem__", "__contains__", "__iter__", "__len__",
+              "__eq__", "__repr__", "get", "keys", "values", "items", "copy", "setdefault",
+              "pop", "popitem", "update", "clear"):
+    setattr(ServerSession, _name, _load_first(getattr(CallbackDict, _name)))
+
+
+def new_session_id():
+    return secrets.token_urlsafe(SESSION_ID_BYTES)
+
+
+class MemorySessionStore:
+    # For tests and single-process runs; sessions die with the process
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+
+    def load(self, sid):
+        with self._lock:
+            row = self._rows.get(sid)
+            if row is not None and row[1] < time.time():
+                del self._rows[sid]
+                return None
+            return row
+
+    def save(self, sid, data, expires):
+        with self._lock:
+            self._rows[sid] = (data, expires)
+
+    def delete(self, sid):
+        with self._lock:
+            self._rows.pop(sid, None)
+
+
+class SqliteSessionStore:
+    def __init__(self):
+        self._next_purge = 0
+
+    def load(self, sid):
+        conn = get_db_conn()
+        c = conn.cursor()
+        c.execute("SELECT data, expires FROM sessions WHERE id=? AND expires > ?",
+                  (sid, int(time.time())))
+        row = c.fetchone()
+        return (row["data"], row["expires"]) if row else None
+
+    def save(self, sid, data, expires):
+        conn = get_db_conn()
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO sessions(id, data, expires) VALUES (?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET data=excluded.data, expires=excluded.expires
+        """, (sid, data, expires))
+        if time.time() >= self._next_purge:
+            self._next_purge = time.time() + SESSION_PURGE_EVERY
+            c.execute("DELETE FROM sessions WHERE expires <= ?", (int(time.time()),))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = get_db_conn()
+        c = conn.cursor()
+        c.execute("DELETE FROM sessions WHERE id=?", (sid,))
+        conn.commit()
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSession()
+
+        def load_row():
+            row = self.store.load(sid)
+            return row and (self.serializer.loads(row[0]), row[1])
+        return ServerSession(sid, load_row)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        # Only responses that used the session vary on Cookie, so media
+        # and assets stay shareable by caches
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session.loaded:
+            return
+
+        if session.old_sid:
+            self.store.delete(session.old_sid)
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = int(app.permanent_session_lifetime.total_seconds())
+        expires = int(time.time()) + lifetime
+        if not session.modified and session.expires + SESSION_REFRESH > expires:
+            return
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), expires)
+        response.set_cookie(
+            name, session.sid, max_age=lifetime, domain=domain, path=path,
+            httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+# ----------- PASSWORDS -----------
+# Passwords are stored as salted scrypt hashes in werkzeug's
+# "scrypt:N:r:p$salt$hash" format. PASSWORD_METHOD sets the cost: about
+# 115 ms and 32 MB per hash, so roughly 9 sign-ins per second per core
+# (bench/login_bench.py). Hashing runs on auth_pool so a burst of sign-ins
+# queues there instead of holding every request thread on the CPU; once
+# AUTH_QUEUE requests are waiting, the rest get a 503 straight away. A
+# waiting sign-in still holds its request thread, so AUTH_WORKERS +
+# AUTH_QUEUE must stay well under gunicorn's THREADS: with the defaults a
+# burst holds at most 5 of 16 threads, none for more than about 0.6 s.
+# scrypt releases the GIL, so a host runs up to WEB_CONCURRENCY *
+# AUTH_WORKERS hashes at once; with gunicorn's one process per core, one
+# thread each is a hash per core. MOM_AUTH_WORKERS and MOM_AUTH_QUEUE
+# override both (see gunicorn.conf.py). Rows still holding a plaintext
+# password, or a hash at an older cost, are rehashed on the next
+# successful sign-in.
+PASSWORD_METHOD = "scrypt:32768:8:1"
+AUTH_WORKERS = int(os.environ.get("MOM_AUTH_WORKERS", 1))
+AUTH_QUEUE = int(os.environ.get("MOM_AUTH_QUEUE", 4))
+
+auth_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+auth_slots = threading.BoundedSemaphore(AUTH_WORKERS + AUTH_QUEUE)
+_dummy_hash = None
+
+
+def run_auth(fn, *args):
+    if not auth_slots.acquire(blocking=False):
+        abort(make_response("Too many sign-ins right now, try again in a moment.", 503,
+                            {"Retry-After": "1"}))
+    try:
+        return auth_pool.submit(fn, *args).result()
+    finally:
+        auth_slots.release()
+
+
+def hash_password(password):
+    return generate_password_hash(password, PASSWORD_METHOD)
+
+
+def is_password_hash(stored):
+    return stored.startswith(("scrypt:", "pbkdf2:")) and stored.count("$") >= 2
+
+
+def verify_password(stored, password):
+    if not stored:
+        return False
+    if not is_password_hash(stored):
+        # Legacy row from before hashing
+        return hmac.compare_digest(stored.encode(), password.encode())
+    return check_password_hash(stored, password)
+
+
+def authenticate(stored, password):
+    # Returns (ok, new_hash); new_hash is set when the row should be rewritten
+    global _dummy_hash
+    if stored is None:
+        # Unknown user: spend the same time, so timing doesn't reveal it
+        _dummy_hash = _dummy_hash or hash_password("")
+        check_password_hash(_dummy_hash, password)
+        return False, None
+    if not verify_password(stored, password):
+        return False, None
+    if not stored.startswith(PASSWORD_METHOD + "$"):
+        return True, hash_password(password)
+    return True, None
+
+
+# ----------- USER CACHE -----------
+# User rows are looked up on nearly every page. Each request keeps the rows
+# it has seen on g (an identity map), backed by a process-wide LRU of recent
+# rows. Routes that change a user row, directly or through the counter
+# triggers, call invalidate_user(); the TTL bounds how long a change made by
+# another process can go unseen.
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 30     # seconds
+
+
+class UserCache:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows = OrderedDict()  # id -> (expires, row)
+        self._ids = {}              # username -> id
+
+    def get(self, uid):
+        with self._lock:
+            entry = self._rows.get(uid)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(uid)
+                return None
+            self._rows.move_to_end(uid)
+            return entry[1]
+
+    def get_id(self, username):
+        with self._lock:
+            return self._ids.get(username)
+
+    def put(self, row):
+        with self._lock:
+            self._drop(row["id"])
+            self._rows[row["id"]] = (time.monotonic() + self.ttl, row)
+            self._ids[row["username"]] = row["id"]
+            while len(self._rows) > self.size:
+                self._drop(next(iter(self._rows)))
+
+    def invalidate(self, uid):
+        with self._lock:
+            self._drop(uid)
+
+    def _drop(self, uid):
+        entry = self._rows.pop(uid, None)
+        if entry is not None and self._ids.get(entry[1]["username"]) == uid:
+            del self._ids[entry[1]["username"]]
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def _request_users():
+    if "users" not in g:
+        g.users = {}
+    return g.users
+
+
+def invalidate_user(*uids):
+    for uid in uids:
+        uid = int(uid)
+        user_cache.invalidate(uid)
+        # Media workers call this outside any request
+        if has_app_context():
+            _request_users().pop(uid, None)
+
+
+# ----------- BASIC USER FUNCTIONS -----------
+def fetch_user_by_username(username):
+    uid = user_cache.get_id(username)
+    if uid is not None:
+        user = fetch_user_by_id(uid)
+        if user is not None and user["username"] == username:
+            return user
+
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute("SELECT * FROM users WHERE username=?", (username,))
+    user = c.fetchone()
+    if user:
+        user_cache.put(user)
+        _request_users()[user["id"]] = user
+    return user
+
+
+def fetch_user_by_id(uid):
+    try:
+        uid = int(uid)
+    except (TypeError, ValueError):
+        return None
+
+    users = _request_users()
+    user = users.get(uid) or user_cache.get(uid)
+    if user is None:
+        conn = get_db_conn()
+        c = conn.cursor()
+        c.execute("SELECT * FROM users WHERE id=?", (uid,))
+        user = c.fetchone()
+        if user is None:
+            return None
+        user_cache.put(user)
+    users[uid] = user
+    return user
+
+
+def is_following(target_id, visitor_id):
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute(
+        "SELECT 1 FROM followers WHERE user_id=? AND follower_id=?",
+        (target_id, visitor_id),
+    )
+    r = c.fetchone()
+    return bool(r)
+
+
+def detect_media_type(filename):
+    ext = os.path.splitext(filename.lower())[1]
+    if ext in (".mp4", ".mov", ".webm", ".mkv", ".ogg"):
+        return "video"
+    return "image"
+
+
+def get_user_posts(uid, cursor=None, limit=None):
+    limit = limit or PAGE_SIZE
+    after, params = keyset_after("ts", "id", cursor, "<")
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT * FROM posts
+        WHERE user_id=? AND ready=1{after}
+        ORDER BY ts DESC, id DESC
+        LIMIT ?
+    """, [uid] + params + [limit + 1])
+    posts = c.fetchall()
+    return keyset_page(posts, limit)
+
+
+# ----------- PAGINATION -----------
+# Listings are paged with keyset cursors on (ts, id), so fetching
+# page N costs the same as fetching page 1.
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def page_size():
+    try:
+        size = int(request.args.get("limit", PAGE_SIZE))
+    except ValueError:
+        size = PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(ts, row_id):
+    raw = f"{ts}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.split("|")
+        return int(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_after(ts_col, id_col, cursor, op):
+    # SQL fragment + params selecting rows strictly past the cursor.
+    # op is "<" for newest-first listings and ">" for oldest-first ones.
+    key = decode_cursor(cursor)
+    if key is None:
+        return "", []
+    return f" AND ({ts_col}, {id_col}) {op} (?, ?)", list(key)
+
+
+def keyset_page(rows, limit):
+    # Queries fetch limit + 1 rows; the extra one only tells us whether
+    # another page exists.
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["ts"], rows[-1]["id"])
+
+
+# ----------- FEED ASSEMBLY -----------
+# SQLite caps the number of bound parameters per statement, so big id lists
+# are split into chunks of this size.
+SQL_CHUNK = 500
+
+
+def _chunks(items, size=SQL_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def attach_post_stats(conn, posts, uid):
+    # The viewer's liked flag for a whole list of posts in one query per
+    # chunk instead of one per post. Like and comment counts already come
+    # with the post rows as maintained counter columns.
+    post_ids = [p["id"] for p in posts]
+    liked = set()
+    c = conn.cursor()
+
+    for chunk in _chunks(post_ids):
+        marks = ",".join("?" * len(chunk))
+        c.execute(f"""
+            SELECT post_id FROM likes
+            WHERE user_id=? AND post_id IN ({marks})
+        """, [uid] + chunk)
+        liked.update(r["post_id"] for r in c.fetchall())
+
+    result = []
+    for p in posts:
+        post = dict(p)
+        post["liked"] = p["id"] in liked
+        result.append(post)
+    return result
+
+
+# ----------- MEDIA PIPELINE -----------
+# Uploads are moved into place inside the request; resized variants and
+# video poster frames are made on a small worker pool. A new post reaches
+# followers' feeds once its variants are done. The pool lives in memory, so
+# jobs queued when a worker stops are lost; `flask thumbnails` finishes
+# those posts. Without Pillow (images) or ffmpeg (posters) the variant is
+# skipped and pages show the original.
+MEDIA_WORKERS = 2
+THUMB_SIZE = 320        # square profile grid thumbnails
+PREVIEW_WIDTH = 1080    # feed images and video poster frames
+AVATAR_SIZE = 300
+JPEG_QUALITY = 82
+FFMPEG = shutil.which("ffmpeg")
+
+media_pool = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+
+
+def upload_too_large(file, media_type):
+    file.stream.seek(0, os.SEEK_END)
+    limit = MAX_VIDEO_BYTES if media_type == "video" else MAX_IMAGE_BYTES
+    return file.stream.tell() > limit
+
+
+def store_upload(file):
+    ext = media_ext(file.filename)
+    spooled = file.stream
+    if isinstance(spooled, SpooledUpload) and os.path.exists(spooled.name):
+        spooled.close()
+        return add_media_file(spooled.name, ext, spooled.sha256.hexdigest(), move=True)
+
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_TMP, delete=False) as tmp:
+        file.save(tmp)
+    return add_media_file(tmp.name, ext, move=True)
+
+
+@bp.teardown_app_request
+def discard_uploads(exc):
+    # Spooled uploads a route did not keep go away with the request
+    files = request.__dict__.get("files")
+    if not files:
+        return
+    for _, file in files.items(multi=True):
+        spooled = getattr(file.stream, "name", None)
+        if isinstance(spooled, str) and os.path.exists(spooled):
+            file.stream.close()
+            os.remove(spooled)
+
+
+def save_jpeg(img, name):
+    path = media_path(name)
+    img.save(path + ".tmp", "JPEG", quality=JPEG_QUALITY, optimize=True)
+    os.replace(path + ".tmp", path)
+
+
+def make_variants(name, media_type):
+    # (thumb, preview) media names, None where not made
+    stem = os.path.splitext(name)[0]
+    thumb = f"{stem}_{THUMB_SIZE}.jpg"
+    preview = f"{stem}_poster.jpg" if media_type == "video" else f"{stem}_{PREVIEW_WIDTH}.jpg"
+    if os.path.exists(media_path(thumb)) and os.path.exists(media_path(preview)):
+        # The same content was uploaded and processed before
+        return thumb, preview
+
+    source = media_path(name)
+    if media_type == "video":
+        if FFMPEG is None:
+            return None, None
+        result = subprocess.run(
+            [FFMPEG, "-y", "-loglevel", "error", "-ss", "1", "-i", source, "-frames:v", "1",
+             "-vf", f"scale='min({PREVIEW_WIDTH},iw)':-2", media_path(preview)],
+            stdin=subprocess.DEVNULL, capture_output=True, timeout=120)
+        if result.returncode != 0 or not os.path.exists(media_path(preview)):
+            return None, None
+        source = media_path(preview)
+
+    if Image is None:
+        return None, preview if media_type == "video" else None
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    save_jpeg(ImageOps.fit(img, (THUMB_SIZE, THUMB_SIZE)), thumb)
+    if media_type == "image":
+        img.thumbnail((PREVIEW_WIDTH, PREVIEW_WIDTH * 4))
+        save_jpeg(img, preview)
+    return thumb, preview
+
+
+def process_post_media(post_id, name, media_type):
+    try:
+        thumb, preview = make_variants(name, media_type)
+    except Exception as e:
+        logger.warning("Could not make variants for post %s: %s", post_id, e)
+        thumb = preview = None
+
+    # Runs on a worker thread, so it has its own connection
+    conn = connect_db()
+    try:
+        c = conn.cursor()
+        c.execute("UPDATE posts SET thumb=?, preview=?, ready=1 WHERE id=?", (thumb, preview, post_id))
+        c.execute("SELECT user_id, ts FROM posts WHERE id=?", (post_id,))
+        post = c.fetchone()
+        if post:
+            fan_out_post(conn, post_id, post["user_id"], post["ts"])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def process_avatar(user_id, name):
+    # Profile photos are only ever shown small. The shrunk copy is stored as
+    # new content and the profile moved onto it, unless the photo changed
+    # again in the meantime.
+    if Image is None:
+        return
+    try:
+        with Image.open(media_path(name)) as img:
+            if max(img.size) <= AVATAR_SIZE:
+                return
+            fmt = img.format
+            img = ImageOps.fit(ImageOps.exif_transpose(img), (AVATAR_SIZE, AVATAR_SIZE))
+        if fmt == "JPEG":
+            img = img.convert("RGB")
+        with tempfile.NamedTemporaryFile(dir=UPLOAD_TMP, delete=False) as tmp:
+            img.save(tmp, fmt)
+        small = add_media_file(tmp.name, os.path.splitext(name)[1], move=True)
+    except Exception as e:
+        logger.warning("Could not resize avatar %s: %s", name, e)
+        return
+
+    conn = connect_db()
+    try:
+        if conn.execute("UPDATE users SET photo=? WHERE id=? AND photo=?",
+                        (small, user_id, name)).rowcount:
+            invalidate_user(user_id)
+            user_index.set_photo(user_id, small)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ----------- TIMELINE -----------
+# Feeds are read from the timeline table, which new posts are copied into
+# for every follower (fan-out on write). Celebrity accounts skip the copy;
+# their posts are merged in when the feed is read.
+def fan_out_post(conn, post_id, author_id, ts, followers=True):
+    c = conn.cursor()
+    c.execute("""
+        INSERT OR IGNORE INTO timeline(user_id, post_id, author_id, ts)
+        VALUES (?, ?, ?, ?)
+    """, (author_id, post_id, author_id, ts))
+    if not followers:
+        return
+    c.execute("""
+        INSERT OR IGNORE INTO timeline(user_id, post_id, author_id, ts)
+        SELECT f.follower_id, ?, ?, ?
+        FROM followers f
+        JOIN users u ON u.id = f.user_id
+        WHERE f.user_id = ? AND u.celebrity = 0
+    """, (post_id, author_id, ts, author_id))
+
+
+def backfill_timeline(conn, uid, target_id):
+    # A new follow copies in the account's recent posts; ones still being
+    # processed reach the follower through process_post_media's fan-out
+    c = conn.cursor()
+    c.execute("SELECT celebrity FROM users WHERE id=?", (target_id,))
+    row = c.fetchone()
+    if row and not row["celebrity"]:
+        c.execute("""
+            INSERT OR IGNORE INTO timeline(user_id, post_id, author_id, ts)
+            SELECT ?, id, user_id, ts FROM posts
+            WHERE user_id = ? AND ready = 1
+            ORDER BY ts DESC, id DESC
+            LIMIT ?
+        """, (uid, target_id, TIMELINE_BACKFILL))
+
+    # Crossing the limit flips the account to merge-on-read for good
+    c.execute("""
+        UPDATE users SET celebrity = 1
+        WHERE id = ? AND celebrity = 0 AND followers_count >= ?
+    """, (target_id, FANOUT_LIMIT))
+
+
+def drop_from_timeline(conn, uid, target_id):
+    conn.execute("""
+        DELETE FROM timeline
+        WHERE user_id = ? AND author_id = ? AND author_id != user_id
+    """, (uid, target_id))
+
+
+def get_feed_posts(uid, cursor=None, limit=None):
+    limit = limit or PAGE_SIZE
+    tl_after, tl_params = keyset_after("t.ts", "t.post_id", cursor, "<")
+    celeb_after, celeb_params = keyset_after("p.ts", "p.id", cursor, "<")
+    conn = get_db_conn()
+    c = conn.cursor()
+
+    # One range read of the reader's timeline, plus the newest posts of any
+    # followed celebrity accounts. The CROSS JOINs make SQLite walk the few
+    # celebrities first instead of everyone the reader follows.
+    c.execute(f"""
+        SELECT p.*, u.username, u.photo AS user_photo
+        FROM (
+            SELECT post_id FROM (
+                SELECT t.post_id FROM timeline t
+                WHERE t.user_id = ?{tl_after}
+                ORDER BY t.ts DESC, t.post_id DESC
+                LIMIT ?)
+            UNION
+            SELECT id FROM (
+                SELECT p.id FROM users cu
+                CROSS JOIN followers f ON f.user_id = cu.id AND f.follower_id = ?
+                CROSS JOIN posts p ON p.user_id = cu.id
+                WHERE cu.celebrity = 1 AND p.ready = 1{celeb_after}
+                ORDER BY p.ts DESC, p.id DESC
+                LIMIT ?)
+        ) page
+        JOIN posts p ON p.id = page.post_id
+        JOIN users u ON p.user_id = u.id
+        ORDER BY p.ts DESC, p.id DESC
+        LIMIT ?
+    """, [uid] + tl_params + [limit + 1, uid] + celeb_params + [limit + 1, limit + 1])
+
+    posts, next_cursor = keyset_page(c.fetchall(), limit)
+    posts = attach_post_stats(conn, posts, uid)
+    return posts, next_cursor
+
+
+def get_post_comments(pid, cursor=None, limit=None):
+    limit = limit or PAGE_SIZE
+    after, params = keyset_after("c.ts", "c.id", cursor, ">")
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT c.*, u.username, u.photo AS user_photo
+        FROM comments c
+        JOIN users u ON c.user_id = u.id
+        WHERE c.post_id=?{after}
+        ORDER BY c.ts, c.id
+        LIMIT ?
+    """, [pid] + params + [limit + 1])
+    comments = c.fetchall()
+    return keyset_page(comments, limit)
+
+
+def get_chat_messages(uid, partner_id, cursor=None, limit=None):
+    # Pages walk backwards from the newest message; each page is returned
+    # oldest-first so it can be rendered top to bottom.
+    limit = limit or PAGE_SIZE
+    after, params = keyset_after("m.ts", "m.id", cursor, "<")
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT m.*, u.username, u.photo AS user_photo
+        FROM messages m
+        JOIN users u ON m.sender_id = u.id
+        WHERE m.conversation_id = ?{after}
+        ORDER BY m.ts DESC, m.id DESC
+        LIMIT ?
+    """, [conversation_key(uid, partner_id)] + params + [limit + 1])
+    msgs, next_cursor = keyset_page(c.fetchall(), limit)
+    msgs.reverse()
+    return msgs, next_cursor
+
+
+def get_new_chat_messages(uid, partner_id, cursor=None):
+    # Messages after the cursor, oldest first, for the live chat stream
+    after, params = keyset_after("m.ts", "m.id", cursor, ">")
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT m.*, u.username, u.photo AS user_photo
+        FROM messages m
+        JOIN users u ON m.sender_id = u.id
+        WHERE m.conversation_id = ?{after}
+        ORDER BY m.ts, m.id
+        LIMIT ?
+    """, [conversation_key(uid, partner_id)] + params + [MAX_PAGE_SIZE])
+    return c.fetchall()
+
+
+# ----------- USER SEARCH -----------
+# Results are ranked (exact username first, then bm25 with username hits
+# weighted over fullname hits) and capped; pages are offsets into that cap.
+SEARCH_MAX_RESULTS = 200
+SEARCH_TRIGRAM = 3      # shorter queries can't use the trigram index
+
+
+def search_users(query, offset=0, limit=None):
+    # (rows, next offset or None)
+    limit = min(limit or PAGE_SIZE, SEARCH_MAX_RESULTS - offset)
+    if not query or limit <= 0:
+        return [], None
+
+    conn = get_db_conn()
+    c = conn.cursor()
+    if len(query) < SEARCH_TRIGRAM:
+        # Username prefix, ignoring case, as a range on its NOCASE index
+        c.execute("""
+            SELECT id, username, fullname, photo FROM users
+            WHERE username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE
+            ORDER BY username COLLATE NOCASE
+            LIMIT ? OFFSET ?
+        """, (query, query + "\U0010ffff", limit + 1, offset))
+    else:
+        # Quoted, the query is one phrase: a substring match, whatever it contains
+        c.execute("""
+            SELECT u.id, u.username, u.fullname, u.photo
+            FROM users_fts
+            JOIN users u ON u.id = users_fts.rowid
+            WHERE users_fts MATCH ?
+            ORDER BY u.username = ? DESC, bm25(users_fts, 10.0, 1.0)
+            LIMIT ? OFFSET ?
+        """, ('"' + query.replace('"', '""') + '"', query, limit + 1, offset))
+
+    rows = c.fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], offset + limit
+
+
+# ----------- TYPEAHEAD -----------
+# Search-as-you-type suggestions come from sorted in-memory key lists
+# searched with bisect, so a keystroke never reaches SQLite. The index is
+# loaded from users when a process serves its first suggestion, and then
+# updated by the routes that change usernames, names and photos. Each
+# process keeps its own copy, and before suggesting, at most every
+# TYPEAHEAD_REFRESH seconds, reads the users whose index_seq went past the
+# last one it saw: those another process added or changed.
+TYPEAHEAD_LIMIT = 8
+TYPEAHEAD_REFRESH = 2   # seconds
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}        # id -> {id, username, fullname, photo}
+        self._usernames = []    # sorted (key, id)
+        self._names = []        # sorted (key, id): each word of the name, and the whole name
+        self.loaded = False
+        self.seq = 0            # highest users.index_seq seen
+        self.checked = 0.0      # time.monotonic() of the last load or refresh
+
+    @staticmethod
+    def _keys(user):
+        fullname = (user["fullname"] or "").casefold()
+        names = set(fullname.split())
+        if fullname.strip():
+            names.add(" ".join(fullname.split()))
+        return user["username"].casefold(), names
+
+    def _insert(self, row, sort):
+        user = {key: row[key] for key in ("id", "username", "fullname", "photo")}
+        self._users[user["id"]] = user
+        username, names = self._keys(user)
+        entries = [(self._usernames, (username, user["id"]))]
+        entries += [(self._names, (name, user["id"])) for name in names]
+        for keys, entry in entries:
+            if sort:
+                bisect.insort(keys, entry)
+            else:
+                keys.append(entry)
+
+    def _remove(self, user_id):
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return
+        username, names = self._keys(user)
+        entries = [(self._usernames, (username, user_id))]
+        entries += [(self._names, (name, user_id)) for name in names]
+        for keys, entry in entries:
+            i = bisect.bisect_left(keys, entry)
+            if i < len(keys) and keys[i] == entry:
+                del keys[i]
+
+    def load(self, fetch_rows):
+        # Rows are read under the lock, so no put() can fall between the
+        # read and the build; until then put() has nothing to update
+        with self._lock:
+            if self.loaded:
+                return
+            self._users, self._usernames, self._names = {}, [], []
+            for row in fetch_rows():
+                self._insert(row, sort=False)
+                self.seq = max(self.seq, row["index_seq"])
+            self._usernames.sort()
+            self._names.sort()
+            self.loaded = True
+            self.checked = time.monotonic()
+
+    def refresh(self, fetch_changed):
+        # fetch_changed(seq) returns the rows stamped after seq
+        with self._lock:
+            for row in fetch_changed(self.seq):
+                self._remove(row["id"])
+                self._insert(row, sort=True)
+                self.seq = max(self.seq, row["index_seq"])
+            self.checked = time.monotonic()
+
+    def stale(self):
+        return time.monotonic() - self.checked >= TYPEAHEAD_REFRESH
+
+    def put(self, user_id, username, fullname, photo):
+        user = {"id": user_id, "username": username, "fullname": fullname, "photo": photo}
+        with self._lock:
+            if not self.loaded:
+                return
+            self._remove(user_id)
+            self._insert(user, sort=True)
+
+    def set_photo(self, user_id, photo):
+        with self._lock:
+            if user_id in self._users:
+                self._users[user_id]["photo"] = photo
+
+    def suggest(self, prefix, limit=TYPEAHEAD_LIMIT):
+        # Username matches first, then name matches, each user once
+        prefix = prefix.casefold()
+        found, seen = [], set()
+        with self._lock:
+            for keys in (self._usernames, self._names):
+                i = bisect.bisect_left(keys, (prefix,))
+                while i < len(keys) and len(found) < limit and keys[i][0].startswith(prefix):
+                    user_id = keys[i][1]
+                    if user_id not in seen:
+                        seen.add(user_id)
+                        found.append(dict(self._users[user_id]))
+                    i += 1
+        return found
+
+
+user_index = PrefixIndex()
+
+
+def load_user_index():
+    if user_index.loaded and not user_index.stale():
+        return
+    conn = get_db_conn()
+    if not user_index.loaded:
+        user_index.load(lambda: conn.execute(
+            "SELECT id, username, fullname, photo, index_seq FROM users").fetchall())
+    else:
+        user_index.refresh(lambda seq: conn.execute(
+            "SELECT id, username, fullname, photo, index_seq FROM users WHERE index_seq > ?",
+            (seq,)).fetchall())
+
+
+def get_inbox(uid, cursor=None, limit=None):
+    # Conversations newest first, each with the partner's user row, the
+    # latest message and the unread count, in a single indexed query
+    limit = limit or PAGE_SIZE
+    after, params = keyset_after("i.ts", "i.partner_id", cursor, "<")
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT u.id, u.username, u.photo, i.ts, i.unread,
+               m.message AS last_message, m.sender_id AS last_sender_id
+        FROM inbox i
+        JOIN users u ON u.id = i.partner_id
+        JOIN messages m ON m.id = i.last_message_id
+        WHERE i.user_id = ?{after}
+        ORDER BY i.ts DESC, i.partner_id DESC
+        LIMIT ?
+    """, [uid] + params + [limit + 1])
+    return keyset_page(c.fetchall(), limit)
+
+
+def mark_read(uid, partner_id):
+    conn = get_db_conn()
+    conn.execute("""
+        UPDATE inbox SET unread = 0, last_read_id = last_message_id
+        WHERE user_id = ? AND partner_id = ? AND last_read_id != last_message_id
+    """, (uid, partner_id))
+    conn.commit()
+
+
+def format_time(timestamp):
+    try:
+        if isinstance(timestamp, int):
+            dt = datetime.datetime.fromtimestamp(timestamp)
+        else:
+            dt = datetime.datetime.fromisoformat(timestamp)
+        now = datetime.datetime.now()
+        diff = now - dt
+        if diff.days > 0:
+            return f"{diff.days}d"
+        elif diff.seconds > 3600:
+            return f"{diff.seconds // 3600}h"
+        elif diff.seconds > 60:
+            return f"{diff.seconds // 60}m"
+        else:
+            return "now"
+    except:
+        return timestamp
+
+# --- PART 1/7 END ---
+# --- PART 2/7 START ---
+
+# ---------------- STATIC ASSETS -----------------
+# The stylesheet and icon sprite are served from fingerprinted URLs, so
+# browsers can cache them for a year and a deploy that changes them just
+# changes the URL.
+ASSET_FILES = ("css/momentum.css", "icons.svg")
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+def _fingerprint(filename):
+    with open(os.path.join(STATIC_FOLDER, filename), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+ASSET_VERSIONS = {name: _fingerprint(name) for name in ASSET_FILES}
+
+
+def asset_url(filename):
+    return f"/assets/{ASSET_VERSIONS[filename]}/{filename}"
+
+
+@bp.route("/assets/<version>/<path:filename>")
+def asset(version, filename):
+    if filename not in ASSET_VERSIONS:
+        abort(404)
+    if version != ASSET_VERSIONS[filename]:
+        # A page rendered before the last deploy; point it at the current file
+        return redirect(asset_url(filename))
+
+    # send_from_directory adds the ETag / Last-Modified pair and answers
+    # conditional requests with 304
+    response = send_from_directory(current_app.static_folder, filename, max_age=ASSET_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# Media bodies go out through the WSGI server's file wrapper, which servers
+# like gunicorn turn into sendfile(2): the file is positioned at the start of
+# the requested range and Content-Length bounds it, so a Range request for
+# the middle of a long video sends only that slice, without passing through
+# Python. Behind nginx, set MEDIA_ACCEL_PREFIX to an internal location
+# aliased to MEDIA_ROOT and nginx serves the bytes instead.
+MEDIA_CHUNK = 256 * 1024    # read size when the server has no file wrapper
+
+
+def _read_range(f, length):
+    # Fallback body for servers without wsgi.file_wrapper; unlike
+    # werkzeug's FileWrapper it stops at the end of the range
+    with f:
+        while length > 0:
+            chunk = f.read(min(MEDIA_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@bp.route("/media/<path:name>")
+def media_file(name):
+    path = os.path.abspath(media_path(name))
+    if not path.startswith(os.path.abspath(MEDIA_ROOT) + os.sep):
+        abort(404)
+    try:
+        f = open(path, "rb")
+    except OSError:
+        abort(404)
+
+    st = os.fstat(f.fileno())
+    response = current_app.response_class(mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream",
+                                  direct_passthrough=True)
+    # Stored names are content hashes, so the bytes behind a URL never change
+    response.set_etag(os.path.basename(name))
+    response.last_modified = st.st_mtime
+    response.cache_control.public = True
+    response.cache_control.max_age = ASSET_MAX_AGE
+    response.cache_control.immutable = True
+
+    prefix = current_app.config["MEDIA_ACCEL_PREFIX"]
+    if prefix:
+        f.close()
+        response.headers["X-Accel-Redirect"] = prefix + name
+        return response
+
+    # Sets 206 / Content-Range / 304 / 416 as the request asks
+    response.content_length = st.st_size
+    try:
+        response.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+    except Exception:
+        f.close()
+        raise
+
+    if response.status_code in (200, 206) and request.method != "HEAD":
+        if response.status_code == 206:
+            f.seek(response.content_range.start)
+        if "wsgi.file_wrapper" in request.environ:
+            response.response = wrap_file(request.environ, f, MEDIA_CHUNK)
+        else:
+            response.response = _read_range(f, response.content_length)
+    else:
+        f.close()
+        response.response = []
+    return response
+
+
+# SVG ICONS — each one references a symbol in the cached sprite
+SVG_ICONS = {
+    name: f'<svg class="icon" viewBox="0 0 24 24"><use href="{asset_url("icons.svg")}#{name}"/></svg>'
+    for name in ('home', 'search', 'add', 'message', 'profile', 'settings', 'heart', 'heart_outline', 'comment')
+}
+
+
+# ---------------- TEMPLATE CONTEXT -----------------
+# Pages live in templates/ and are compiled once by Jinja, then reused from
+# its cache; only the data changes per request. create_app() sets up the
+# environment.
+@bp.app_context_processor
+def inject_nav_user():
+    # The bottom nav links to the signed-in user's profile
+    user = fetch_user_by_id(session["user_id"]) if "user_id" in session else None
+    if not user:
+        return {}
+    return {"nav_username": user["username"]}
+
+
+def more_url(path, cursor):
+    # Where the infinite-scroll sentinel fetches the next page from
+    return f"{path}?cursor={cursor}" if cursor else None
+
+
+# ---------------- POST FRAGMENTS -----------------
+# A post's card is rendered once per (post, version, viewer liked it) and
+# then served from an LRU, so a feed page only renders the posts that
+# changed since they were last shown. The author's photo is part of the
+# key because changing it does not touch the post row. Fragments hold
+# nothing relative to the current time, so they never go stale by age:
+# anything showing format_time() must stay outside them.
+FRAGMENT_CACHE_SIZE = 10000
+
+
+class FragmentCache:
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._html = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            html = self._html.get(key)
+            if html is not None:
+                self._html.move_to_end(key)
+            return html
+
+    def put(self, key, html):
+        with self._lock:
+            self._html[key] = html
+            self._html.move_to_end(key)
+            while len(self._html) > self.size:
+                self._html.popitem(last=False)
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_SIZE)
+
+
+def post_fragment(macro, p):
+    liked = bool(p["liked"]) if "liked" in p.keys() else False
+    key = (macro, p["id"], p["version"], liked, p["user_photo"])
+    html = fragment_cache.get(key)
+    if html is None:
+        html = get_template_attribute("_items.html", macro)(p)
+        fragment_cache.put(key, html)
+    return html
+
+
+# ---------------- CONDITIONAL GET -----------------
+# Pages that are refreshed/polled a lot get a weak ETag built from the data
+# they are rendered from, so an unchanged page answers 304 before any
+# listing query or template render runs.
+def render_version(app):
+    # Changes whenever a deploy touches templates or static assets
+    digest = hashlib.sha256()
+    for name in sorted(app.jinja_env.list_templates()):
+        digest.update(name.encode())
+        digest.update(app.jinja_loader.get_source(app.jinja_env, name)[0].encode())
+    return digest.hexdigest()[:12] + "".join(ASSET_VERSIONS.values())
+
+
+def page_etag(*data_version):
+    key = repr((current_app.config["RENDER_VERSION"], session.get("user_id"), page_size(),
+                data_version))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional_page(etag, render):
+    if request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    # Browsers keep the copy but must revalidate it on every view
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+# ---------------- COMPRESSION -----------------
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 6
+COMPRESS_MIMETYPES = {
+    "text/html", "text/css", "text/plain", "application/json",
+    "application/javascript", "image/svg+xml",
+}
+
+
+@bp.after_app_request
+def compress_response(response):
+    # File responses (send_from_directory) stream from disk and are left as-is
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if brotli is not None and request.accept_encodings["br"]:
+        response.set_data(brotli.compress(data, quality=COMPRESS_LEVEL - 1))
+        response.headers["Content-Encoding"] = "br"
+    elif request.accept_encodings["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+# ---------------- LIVE CHAT -----------------
+# Open chat windows hold a Server-Sent Events stream. Sending a message
+# publishes a wake-up on the conversation's channel; each stream then reads
+# the rows past its own cursor from the database and pushes just those.
+# The hub only carries wake-ups, so a broker-backed one (Redis pub/sub and
+# the like) with the same three methods can replace LocalHub when the app
+# runs as several processes.
+#
+# A stream occupies a worker thread while it is open, so each process runs
+# at most SSE_MAX_STREAMS of them (keep it well under gunicorn's THREADS)
+# and ends each after SSE_MAX_AGE; the browser reconnects and resumes from
+# Last-Event-ID. Past the cap, a chat gets what is new and is told to come
+# back in SSE_BUSY_RETRY, so it polls until a slot frees up.
+SSE_KEEPALIVE = 15      # seconds between keepalives, and between re-checks
+                        # for rows written by other processes
+SSE_MAX_STREAMS = int(os.environ.get("MOM_SSE_MAX_STREAMS", 8))
+SSE_MAX_AGE = 300       # seconds
+SSE_RETRY = 3           # seconds a browser waits before reconnecting
+SSE_BUSY_RETRY = 30     # ... when every stream slot was taken
+
+chat_streams = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+
+class LocalHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channel):
+        # A one-slot queue: wake-ups that arrive while a stream is busy
+        # collapse into one, since the stream reads everything new anyway
+        q = queue.Queue(maxsize=1)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(q)
+        return q
+
+    def unsubscribe(self, channel, q):
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def publish(self, channel):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(True)
+            except queue.Full:
+                pass
+
+
+chat_hub = LocalHub()
+
+
+def sse_event(data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"data: {line}" for line in data.splitlines()]
+    return "\n".join(lines) + "\n\n"
+
+
+def sse_retry(seconds):
+    return f"retry: {seconds * 1000}\n\n"
+
+
+# ================= AUTH ROUTES ===================
+
+@bp.route("/")
+def home():
+    if "user_id" in session:
+        return redirect("/feed")
+    return render_template("home.html")
+
+
+@bp.route("/login", methods=["POST"])
+def login():
+    username = request.form.get("username", "")
+    password = request.form.get("password", "")
+
+    # Straight from the database: a cached row could hold a replaced password
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute("SELECT id, password FROM users WHERE username=?", (username,))
+    user = c.fetchone()
+    ok, new_hash = run_auth(authenticate, user["password"] if user else None, password)
+
+    if ok:
+        if new_hash:
+            c.execute("UPDATE users SET password=? WHERE id=? AND password=?",
+                      (new_hash, user["id"], user["password"]))
+            conn.commit()
+            invalidate_user(user["id"])
+
+        # A fresh session id on sign-in, so one planted earlier is useless
+        session.clear()
+        session.rotate()
+        session["user_id"] = user["id"]
+        return redirect("/feed")
+    else:
+        return "Invalid username or password!"
+
+
+@bp.route("/register")
+def register():
+    return render_template("register.html")
+
+
+@bp.route("/register_now", methods=["POST"])
+def register_now():
+    fullname = request.form["fullname"]
+    username = request.form["username"]
+    email = request.form["email"]
+    password = run_auth(hash_password, request.form["password"])
+    age = request.form["age"]
+
+    file = request.files["photo"]
+    if upload_too_large(file, "image"):
+        return "Photo is too large."
+    filename = store_upload(file)
+
+    conn = get_db_conn()
+    c = conn.cursor()
+
+    try:
+        c.execute("""
+            INSERT INTO users(fullname, username, email, password, age, photo)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (fullname, username, email, password, age, filename))
+        conn.commit()
+    except:
+        conn.rollback()
+        return "Username or Email already taken."
+
+    user_index.put(c.lastrowid, username, fullname, filename)
+    media_pool.submit(process_avatar, c.lastrowid, filename)
+    return redirect("/")
+
+
+@bp.route("/logout")
+def logout():
+    session.clear()
+    return redirect("/")
+
+# --- PART 2/7 END ---
+# --- PART 3/7 START ---
+
+# ================= FEED PAGE ====================
+
+@bp.route("/feed")
+def feed():
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+
+    posts, next_cursor = get_feed_posts(uid, limit=page_size())
+
+    return render_template("feed.html", page="feed", posts=posts,
+                           next_url=more_url("/feed/more", next_cursor))
+
+
+@bp.route("/feed/more")
+def feed_more():
+    if "user_id" not in session:
+        return redirect("/")
+    uid = session["user_id"]
+
+    posts, next_cursor = get_feed_posts(uid, request.args.get("cursor"), page_size())
+    return render_template("_feed_page.html", posts=posts,
+                           next_url=more_url("/feed/more", next_cursor))
+
+
+
+# ================= CREATE POST ====================
+
+@bp.route("/create")
+def create():
+    if "user_id" not in session:
+        return redirect("/")
+    return render_template("create.html", page="create")
+
+
+@bp.route("/create_now", methods=["POST"])
+def create_now():
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+    caption = request.form.get("caption", "")
+
+    file = request.files["media"]
+    media_type = detect_media_type(file.filename)
+    if upload_too_large(file, media_type):
+        return "File is too large."
+    filename = store_upload(file)
+
+    now = datetime.datetime.now()
+
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute("""
+        INSERT INTO posts(user_id, caption, media, media_type, timestamp, ts, ready)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+    """, (uid, caption, filename, media_type, now.isoformat(), int(now.timestamp())))
+    post_id = c.lastrowid
+    # The author sees the post straight away; followers once it is processed
+    fan_out_post(conn, post_id, uid, int(now.timestamp()), followers=False)
+    conn.commit()
+    invalidate_user(uid)
+
+    media_pool.submit(process_post_media, post_id, filename, media_type)
+    return redirect("/feed")
+
+
+
+# ================= LIKE SYSTEM ====================
+
+@bp.route("/like/<pid>")
+def like(pid):
+    if "user_id" not in session:
+        return redirect("/")
+    uid = session["user_id"]
+
+    conn = get_db_conn()
+    c = conn.cursor()
+
+    # Toggle without a separate read, so two concurrent taps can't both
+    # decide to insert and trip the UNIQUE constraint.
+    c.execute("DELETE FROM likes WHERE post_id=? AND user_id=?", (pid, uid))
+    if c.rowcount == 0:
+        c.execute("INSERT OR IGNORE INTO likes(post_id, user_id) VALUES (?, ?)", (pid, uid))
+
+    conn.commit()
+    return redirect("/feed")
+
+
+
+# ================= COMMENT SYSTEM ====================
+
+@bp.route("/comment/<pid>", methods=["POST"])
+def comment(pid):
+    if "user_id" not in session:
+        return redirect("/")
+    uid = session["user_id"]
+    comment_text = request.form.get("comment", "").strip()
+
+    if comment_text:
+        now = datetime.datetime.now()
+        conn = get_db_conn()
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO comments(post_id, user_id, comment, timestamp, ts)
+            VALUES (?, ?, ?, ?, ?)
+        """, (pid, uid, comment_text, now.isoformat(), int(now.timestamp())))
+        conn.commit()
+
+    return redirect(f"/post/{pid}/comments")
+
+
+# ================= VIEW SINGLE POST COMMENTS PAGE ===================
+
+@bp.route("/post/<pid>/comments")
+def post_comments(pid):
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+
+    conn = get_db_conn()
+    c = conn.cursor()
+
+    # Fetch post
+    c.execute("""
+        SELECT p.*, u.username, u.photo AS user_photo
+        FROM posts p 
+        JOIN users u ON p.user_id = u.id
+        WHERE p.id=?
+    """, (pid,))
+    post = c.fetchone()
+    if not post:
+        return "Post not found."
+
+    # comment_count on the post row moves with every new comment
+    etag = page_etag(tuple(post))
+
+    def render():
+        # Fetch comments
+        comments, next_cursor = get_post_comments(pid, limit=page_size())
+        return render_template("post_comments.html", post=post, comments=comments,
+                               next_url=more_url(f"/post/{pid}/comments/more", next_cursor))
+
+    return conditional_page(etag, render)
+
+
+@bp.route("/post/<pid>/comments/more")
+def post_comments_more(pid):
+    if "user_id" not in session:
+        return redirect("/")
+
+    comments, next_cursor = get_post_comments(pid, request.args.get("cursor"), page_size())
+    return render_template("_comments_page.html", comments=comments,
+                           next_url=more_url(f"/post/{pid}/comments/more", next_cursor))
+
+# --- PART 3/7 END ---
+# --- PART 4/7 START ---
+
+# =================== SEARCH PAGE =====================
+
+@bp.route("/search", methods=["GET", "POST"])
+def search():
+    if "user_id" not in session:
+        return redirect("/")
+
+    query = request.values.get("query", "").strip()
+    results, next_offset = search_users(query, limit=page_size())
+    return render_template("search.html", page="search", query=query, results=results,
+                           next_url=search_more_url(query, next_offset))
+
+
+@bp.route("/search/more")
+def search_more():
+    if "user_id" not in session:
+        return redirect("/")
+
+    query = request.args.get("query", "").strip()
+    offset = request.args.get("offset", 0, type=int)
+    results, next_offset = search_users(query, max(offset, 0), page_size())
+    return render_template("_search_page.html", results=results,
+                           next_url=search_more_url(query, next_offset))
+
+
+def search_more_url(query, offset):
+    return f"/search/more?query={quote(query)}&offset={offset}" if offset else None
+
+
+@bp.route("/search/suggest")
+def search_suggest():
+    if "user_id" not in session:
+        abort(401)
+
+    query = request.args.get("q", "").strip()
+    load_user_index()
+    response = jsonify(user_index.suggest(query) if query else [])
+    # The same prefix typed again within a minute is answered by the browser
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response
+
+
+
+# ================= FOLLOW USER =====================
+
+@bp.route("/follow/<tid>")
+def follow(tid):
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+
+    conn = get_db_conn()
+    c = conn.cursor()
+    try:
+        c.execute("INSERT INTO followers(user_id, follower_id) VALUES (?, ?)", (tid, uid))
+        backfill_timeline(conn, uid, tid)
+        conn.commit()
+        invalidate_user(uid, tid)
+    except:
+        conn.rollback()
+
+    target = fetch_user_by_id(tid)
+    return redirect(f"/profile/{target['username']}")
+
+
+# ================= UNFOLLOW USER =====================
+
+@bp.route("/unfollow/<tid>")
+def unfollow(tid):
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute("DELETE FROM followers WHERE user_id=? AND follower_id=?", (tid, uid))
+    if c.rowcount:
+        drop_from_timeline(conn, uid, tid)
+    conn.commit()
+    invalidate_user(uid, tid)
+
+    target = fetch_user_by_id(tid)
+    return redirect(f"/profile/{target['username']}")
+
+
+# ================= PROFILE PAGE =====================
+
+@bp.route("/profile/<username>")
+def profile(username):
+    if "user_id" not in session:
+        return redirect("/")
+
+    viewer_id = session["user_id"]
+
+    target = fetch_user_by_username(username)
+    if not target:
+        return "User not found."
+
+    target_id = target["id"]
+
+    own_profile = viewer_id == target_id
+    following = not own_profile and is_following(target_id, viewer_id)
+
+    # The user row carries posts_count, so a new post changes the ETag too;
+    # the pending count covers a post leaving processing
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM posts WHERE user_id=? AND ready=0", (target_id,))
+    etag = page_etag(tuple(target), following, c.fetchone()[0])
+
+    def render():
+        # Post grid
+        posts, next_cursor = get_user_posts(target_id, limit=page_size())
+        return render_template("profile.html", page="profile", target=target,
+                               own_profile=own_profile, following=following, posts=posts,
+                               next_url=more_url(f"/profile/{username}/more", next_cursor))
+
+    return conditional_page(etag, render)
+
+
+@bp.route("/profile/<username>/more")
+def profile_more(username):
+    if "user_id" not in session:
+        return redirect("/")
+
+    target = fetch_user_by_username(username)
+    if not target:
+        return ""
+
+    posts, next_cursor = get_user_posts(target["id"], request.args.get("cursor"), page_size())
+    return render_template("_grid_page.html", posts=posts,
+                           next_url=more_url(f"/profile/{username}/more", next_cursor))
+
+# --- PART 4/7 END ---
+# --- PART 5/7 START ---
+
+# ================= DIRECT MESSAGE (INBOX) =====================
+
+@bp.route("/direct")
+def direct():
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+
+    partners, next_cursor = get_inbox(uid, limit=page_size())
+    return render_template("direct.html", page="direct", partners=partners, me=uid,
+                           next_url=more_url("/direct/more", next_cursor))
+
+
+@bp.route("/direct/more")
+def direct_more():
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+    partners, next_cursor = get_inbox(uid, request.args.get("cursor"), page_size())
+    return render_template("_inbox_page.html", partners=partners, me=uid,
+                           next_url=more_url("/direct/more", next_cursor))
+
+
+# ================= CHAT WINDOW =====================
+
+@bp.route("/chat/<username>", methods=["GET", "POST"])
+def chat(username):
+    if "user_id" not in session:
+        return redirect("/")
+
+    sender_id = session["user_id"]
+    receiver = fetch_user_by_username(username)
+
+    if not receiver:
+        return "User does not exist."
+
+    receiver_id = receiver["id"]
+
+    # SEND MESSAGE
+    if request.method == "POST":
+        msg = request.form.get("message", "").strip()
+        if msg:
+            now = datetime.datetime.now()
+            conn = get_db_conn()
+            c = conn.cursor()
+            c.execute("""
+                INSERT INTO messages(sender_id, receiver_id, message, timestamp, ts, conversation_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (sender_id, receiver_id, msg, now.isoformat(), int(now.timestamp()),
+                  conversation_key(sender_id, receiver_id)))
+            conn.commit()
+            chat_hub.publish(conversation_key(sender_id, receiver_id))
+
+        # The chat page posts in the background and gets the message back
+        # over its event stream
+        if request.headers.get("X-Requested-With") == "fetch":
+            return "", 204
+        return redirect(f"/chat/{username}")
+
+    mark_read(sender_id, receiver_id)
+
+    # Messages are append-only, so the conversation's latest message and how
+    # far the partner has read are the page's version; both are inbox rows
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute("""
+        SELECT
+            (SELECT last_message_id FROM inbox WHERE user_id=? AND partner_id=?) AS last_id,
+            (SELECT last_read_id FROM inbox WHERE user_id=? AND partner_id=?) AS seen_id
+    """, (sender_id, receiver_id, receiver_id, sender_id))
+    last_id, seen_id = c.fetchone()
+    etag = page_etag(tuple(receiver), last_id, seen_id)
+
+    def render():
+        # FETCH CHAT HISTORY (latest page; older pages load on scroll-up)
+        msgs, next_cursor = get_chat_messages(sender_id, receiver_id, limit=page_size())
+        last_cursor = encode_cursor(msgs[-1]["ts"], msgs[-1]["id"]) if msgs else None
+        return render_template("chat.html", receiver=receiver, msgs=msgs, me=sender_id,
+                               seen_id=seen_id or 0,
+                               events_url=more_url(f"/chat/{username}/events", last_cursor)
+                                          or f"/chat/{username}/events",
+                               next_url=more_url(f"/chat/{username}/more", next_cursor))
+
+    return conditional_page(etag, render)
+
+
+@bp.route("/chat/<username>/more")
+def chat_more(username):
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+    partner = fetch_user_by_username(username)
+    if not partner:
+        return ""
+
+    msgs, next_cursor = get_chat_messages(uid, partner["id"], request.args.get("cursor"), page_size())
+    return render_template("_chat_page.html", msgs=msgs, me=uid,
+                           next_url=more_url(f"/chat/{username}/more", next_cursor))
+
+
+@bp.route("/chat/<username>/events")
+def chat_events(username):
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+    partner = fetch_user_by_username(username)
+    if not partner:
+        abort(404)
+
+    partner_id = partner["id"]
+    channel = conversation_key(uid, partner_id)
+    # A reconnecting EventSource resumes from the last event it got
+    start = request.headers.get("Last-Event-ID") or request.args.get("cursor")
+    bubble = get_template_attribute("_items.html", "message_bubble")
+    app = current_app._get_current_object()
+
+    def read(cursor):
+        # The stream outlives the request context; each read runs in an app
+        # context of its own, so its connection is closed again before the
+        # stream goes back to waiting
+        with app.app_context():
+            msgs = get_new_chat_messages(uid, partner_id, cursor)
+            if any(m["sender_id"] == partner_id for m in msgs):
+                mark_read(uid, partner_id)
+            events = []
+            for m in msgs:
+                cursor = encode_cursor(m["ts"], m["id"])
+                events.append(sse_event(str(bubble(m, uid)), cursor))
+        return "".join(events), cursor
+
+    def stream():
+        if not chat_streams.acquire(blocking=False):
+            yield sse_retry(SSE_BUSY_RETRY) + read(start)[0]
+            return
+        # Subscribe before the first read so nothing sent in between is missed
+        wakeups = chat_hub.subscribe(channel)
+        deadline = time.monotonic() + SSE_MAX_AGE
+        cursor = start
+        try:
+            events, cursor = read(cursor)
+            yield sse_retry(SSE_RETRY) + events
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                try:
+                    woken = wakeups.get(timeout=min(SSE_KEEPALIVE, left))
+                except queue.Empty:
+                    woken = False
+                # Re-read on timeouts too: messages sent through another
+                # process never wake this stream
+                events, cursor = read(cursor)
+                if events:
+                    yield events
+                elif not woken:
+                    yield ": keepalive\n\n"
+        finally:
+            chat_hub.unsubscribe(channel, wakeups)
+            chat_streams.release()
+
+    response = current_app.response_class(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# --- PART 5/7 END ---
+# --- PART 6/7 START ---
+
+# ================= SETTINGS PAGE =====================
+
+@bp.route("/settings")
+def settings():
+    if "user_id" not in session:
+        return redirect("/")
+
+    return render_template("settings.html")
+
+
+# ================= EDIT PROFILE PAGE =====================
+
+@bp.route("/edit_profile", methods=["GET", "POST"])
+def edit_profile():
+    if "user_id" not in session:
+        return redirect("/")
+
+    user = fetch_user_by_id(session["user_id"])
+
+    if request.method == "POST":
+        fullname = request.form.get("fullname", user["fullname"])
+        email = request.form.get("email", user["email"])
+        age = request.form.get("age", user["age"])
+
+        photo_file = request.files.get("photo", None)
+        filename = user["photo"]
+        if photo_file and photo_file.filename:
+            if upload_too_large(photo_file, "image"):
+                return "Photo is too large."
+            filename = store_upload(photo_file)
+
+        conn = get_db_conn()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE users 
+            SET fullname=?, email=?, age=?, photo=?
+            WHERE id=?
+        """, (fullname, email, age, filename, user["id"]))
+        conn.commit()
+        invalidate_user(user["id"])
+        user_index.put(user["id"], user["username"], fullname, filename)
+        if filename != user["photo"]:
+            media_pool.submit(process_avatar, user["id"], filename)
+
+        return redirect(f"/profile/{user['username']}")
+
+    return render_template("edit_profile.html", user=user)
+
+
+# ================= CHANGE PASSWORD =====================
+
+@bp.route("/change_password", methods=["GET", "POST"])
+def change_password():
+    if "user_id" not in session:
+        return redirect("/")
+
+    uid = session["user_id"]
+
+    if request.method == "POST":
+        old = request.form.get("old_password", "")
+        new = request.form.get("new_password", "")
+
+        # Straight from the database, as in login(): a cached row could
+        # still hold the password another worker just replaced
+        conn = get_db_conn()
+        c = conn.cursor()
+        c.execute("SELECT password FROM users WHERE id=?", (uid,))
+        stored = c.fetchone()["password"]
+        if not run_auth(verify_password, stored, old):
+            return "Old password incorrect!"
+
+        hashed = run_auth(hash_password, new)
+        c.execute("UPDATE users SET password=? WHERE id=? AND password=?", (hashed, uid, stored))
+        conn.commit()
+        if not c.rowcount:
+            return "Your password was just changed elsewhere; try again."
+        invalidate_user(uid)
+
+        return redirect("/settings")
+
+    return render_template("change_password.html")
+
+# --- PART 6/7 END ---
+# --- PART 7/7 START ---
+
+# ========== ROOT REDIRECT ==========
+@bp.route("/home")
+def goto_home():
+    return redirect("/feed")
+
+
+# ========== APP FACTORY ==========
+# Each worker process calls this once (see wsgi.py). It touches neither the
+# database nor the media folders' contents: migrations run beforehand with
+# `flask --app mom migrate`, and the typeahead index loads on first use.
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY="supersecret",
+        # Bigger bodies are refused with 413 before any of it is written
+        MAX_CONTENT_LENGTH=MAX_VIDEO_BYTES + 1024 * 1024,
+        MEDIA_ACCEL_PREFIX=None,
+        SESSION_STORE=None,
+        METRICS=False,
+        SLOW_QUERY_MS=100,
+    )
+    # MOM_SECRET_KEY, MOM_MEDIA_ACCEL_PREFIX, ... from the environment
+    app.config.from_prefixed_env("MOM")
+    app.config.update(config or {})
+
+    os.makedirs(MEDIA_ROOT, exist_ok=True)
+    os.makedirs(UPLOAD_TMP, exist_ok=True)
+
+    app.request_class = UploadRequest
+    app.session_interface = ServerSessionInterface(app.config["SESSION_STORE"] or SqliteSessionStore())
+    app.teardown_appcontext(close_db_conn)
+
+    app.jinja_env.trim_blocks = True
+    app.jinja_env.lstrip_blocks = True
+    app.jinja_env.globals["asset_url"] = asset_url
+    app.jinja_env.globals["format_time"] = format_time
+    app.jinja_env.globals["post_fragment"] = post_fragment
+    app.jinja_env.globals["icons"] = {name: Markup(svg) for name, svg in SVG_ICONS.items()}
+
+    metrics.enabled = bool(app.config["METRICS"])
+    metrics.slow_query = app.config["SLOW_QUERY_MS"] / 1000
+    if metrics.enabled:
+        before_render_template.connect(start_render_timer, app)
+        template_rendered.connect(record_render, app)
+
+    app.register_blueprint(bp)
+    app.config["RENDER_VERSION"] = render_version(app)
+    return app
+
+
+# ========== FLASK RUNNER ==========
+# Development only; production runs wsgi:app under gunicorn
+
+if __name__ == "__main__":
+    init_db()
+    create_app().run(host="0.0.0.0", port=5000)
+
 # --- PART 7/7 END ---
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os, sys, time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mom
+
+PASSWORD = "password"
+
+
+class InlinePool:
+    # Runs media jobs on the calling thread, so their effects are visible
+    # as soon as the request returns
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # A freshly migrated database in a scratch directory; the app keeps
+    # users.db, media/ and uploads/ relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(mom, "PASSWORD_METHOD", "scrypt:1024:8:1")
+    monkeypatch.setattr(mom, "media_pool", InlinePool())
+    monkeypatch.setattr(mom, "user_cache", mom.UserCache(mom.USER_CACHE_SIZE, mom.USER_CACHE_TTL))
+    monkeypatch.setattr(mom, "user_index", mom.PrefixIndex())
+    monkeypatch.setattr(mom, "fragment_cache", mom.FragmentCache(mom.FRAGMENT_CACHE_SIZE))
+    mom.init_db()
+    conn = mom.connect_db()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def app(db):
+    return mom.create_app({"TESTING": True})
+
+
+def add_user(conn, username, fullname=None, photo=None):
+    c = conn.cursor()
+    c.execute("""
+        INSERT INTO users(fullname, username, email, password, age, photo)
+        VALUES (?, ?, ?, ?, 20, ?)
+    """, (fullname or username.title(), username, username + "@example.com",
+          mom.hash_password(PASSWORD), photo))
+    conn.commit()
+    return c.lastrowid
+
+
+def add_post(conn, user_id, caption="", media=None):
+    now = int(time.time())
+    c = conn.cursor()
+    c.execute("""
+        INSERT INTO posts(user_id, caption, media, media_type, timestamp, ts)
+        VALUES (?, ?, ?, 'image', ?, ?)
+    """, (user_id, caption, media, time.strftime("%Y-%m-%dT%H:%M:%S"), now))
+    conn.commit()
+    return c.lastrowid
+
+
+def add_message(conn, sender_id, receiver_id, text="hi"):
+    now = int(time.time())
+    c = conn.cursor()
+    c.execute("""
+        INSERT INTO messages(sender_id, receiver_id, message, timestamp, ts)
+        VALUES (?, ?, ?, ?, ?)
+    """, (sender_id, receiver_id, text, time.strftime("%Y-%m-%dT%H:%M:%S"), now))
+    conn.commit()
+    return c.lastrowid
+
+
+@pytest.fixture
+def login(app):
+    def login(username):
+        client = app.test_client()
+        response = client.post("/login", data={"username": username, "password": PASSWORD})
+        assert response.status_code == 302
+        return client
+    return login
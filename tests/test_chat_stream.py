@@ -0,0 +1,33 @@
+# The live chat stream must deliver messages written by other processes,
+# which never wake it through chat_hub.
+import threading, time
+
+import mom
+from conftest import add_message, add_user
+
+
+def test_stream_rereads_on_keepalive(db, login, monkeypatch):
+    monkeypatch.setattr(mom, "SSE_KEEPALIVE", 0.2)
+    monkeypatch.setattr(mom, "SSE_MAX_AGE", 5)
+    alice, bob = add_user(db, "alice"), add_user(db, "bob")
+    add_message(db, bob, alice, "before")
+    client = login("alice")
+
+    def other_process():
+        time.sleep(0.5)
+        conn = mom.connect_db()
+        add_message(conn, bob, alice, "from elsewhere")
+        conn.close()
+
+    writer = threading.Thread(target=other_process)
+    writer.start()
+    response = client.get("/chat/bob/events", buffered=False)
+    got = ""
+    for chunk in response.response:
+        got += chunk.decode() if isinstance(chunk, bytes) else chunk
+        if "from elsewhere" in got:
+            break
+    response.close()
+    writer.join()
+    assert "before" in got and "from elsewhere" in got
+    assert ": keepalive" in got
@@ -0,0 +1,108 @@
+# Every statement the hot routes run is checked with EXPLAIN QUERY PLAN:
+# none may scan a whole table, and each route's main query must search the
+# index that was added for it.
+import re
+
+import pytest
+
+import mom
+from conftest import add_message, add_post, add_user
+
+# A full pass over a table or subquery, as opposed to SCAN ... USING
+# INDEX, a constant row or an FTS virtual table
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+SUBQUERY = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\w+)$")
+
+ROUTES = [
+    ("/feed", ["SEARCH t USING PRIMARY KEY (user_id=?)", "idx_posts_user_ts", "sqlite_autoindex_likes_1"]),
+    ("/profile/bob", ["idx_posts_user_ts", "idx_posts_pending", "sqlite_autoindex_followers_1"]),
+    ("/post/{post}/comments", ["idx_comments_post_ts"]),
+    ("/direct", ["idx_inbox_recent"]),
+    ("/chat/bob", ["idx_messages_conversation_ts"]),
+    ("/search?query=bo", ["idx_users_username_nocase"]),
+    ("/search?query=jones", ["users_fts"]),
+]
+
+
+@pytest.fixture
+def traced(app, monkeypatch):
+    # Top-level statements run on any connection the app opens
+    statements = []
+    connect = mom.connect_db
+
+    def connect_db():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(mom, "connect_db", connect_db)
+    return statements
+
+
+@pytest.fixture
+def seeded(db):
+    alice, bob = add_user(db, "alice"), add_user(db, "bob", "Bob Jones")
+    db.execute("INSERT INTO followers(user_id, follower_id) VALUES (?, ?)", (bob, alice))
+    post = add_post(db, bob, "hello")
+    db.execute("INSERT INTO timeline(user_id, post_id, author_id, ts) SELECT ?, id, user_id, ts "
+               "FROM posts", (alice,))
+    db.execute("INSERT INTO comments(post_id, user_id, comment, timestamp, ts) VALUES (?, ?, 'hi', '', 1)",
+               (post, alice))
+    db.commit()
+    add_message(db, alice, bob)
+    return {"post": post}
+
+
+def query_plan(conn, sql):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def table_scans(plan):
+    # Scanning a subquery's own result (MATERIALIZE page ... SCAN page) is fine
+    subqueries = {m.group(1) for m in map(SUBQUERY.match, plan) if m}
+    return [step for step in plan
+            if FULL_SCAN.match(step) and FULL_SCAN.match(step).group(1) not in subqueries]
+
+
+def plans(conn, statements):
+    # Statements inside triggers and FTS5 come prefixed with "--" or as
+    # 'main'.-qualified SQL; they are covered by their outer statement
+    for sql in statements:
+        if sql.startswith("--") or "'main'." in sql or sql.lstrip().upper().startswith("PRAGMA"):
+            continue
+        yield sql, query_plan(conn, sql)
+
+
+@pytest.mark.parametrize("path, indexes", ROUTES)
+def test_route_uses_indexes(db, login, seeded, traced, path, indexes):
+    client = login("alice")
+    mom.user_cache.invalidate(1)
+    traced.clear()
+    assert client.get(path.format(**seeded)).status_code == 200
+
+    steps = []
+    for sql, plan in plans(db, traced):
+        assert not table_scans(plan), (sql, plan)
+        steps += plan
+    for index in indexes:
+        assert any(index in step for step in steps), (index, steps)
+
+
+def test_session_load_uses_primary_key(db):
+    plan = query_plan(db, "SELECT data, expires FROM sessions WHERE id='x' AND expires > 0")
+    assert plan == ["SEARCH sessions USING PRIMARY KEY (id=?)"]
+
+
+def test_typeahead_refresh_uses_index(db):
+    plan = query_plan(db, "SELECT id, username, fullname, photo, index_seq FROM users WHERE index_seq > 0")
+    assert plan and plan[0].startswith("SEARCH users USING INDEX idx_users_index_seq")
+
+
+def test_media_and_assets_run_no_queries(db, login, traced):
+    add_user(db, "alice")
+    client = login("alice")
+    traced.clear()
+    responses = [client.get("/media/ab/cd/missing.jpg"), client.get(mom.asset_url("css/momentum.css"))]
+    assert traced == []
+    assert all("Cookie" not in response.vary for response in responses)
+    assert "Cookie" in client.get("/feed").vary
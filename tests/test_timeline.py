@@ -0,0 +1,21 @@
+# Posts reach followers' feeds only once their media is processed.
+import mom
+from conftest import add_post, add_user
+
+
+def timeline(conn, user_id):
+    return [r[0] for r in conn.execute("SELECT post_id FROM timeline WHERE user_id=?", (user_id,))]
+
+
+def test_follow_backfills_only_ready_posts(db, login):
+    alice, bob = add_user(db, "alice"), add_user(db, "bob")
+    ready = add_post(db, bob, "done")
+    pending = add_post(db, bob, "processing")
+    db.execute("UPDATE posts SET ready = 0 WHERE id=?", (pending,))
+    db.commit()
+
+    login("alice").get(f"/follow/{bob}")
+    assert timeline(db, alice) == [ready]
+
+    mom.process_post_media(pending, None, "image")
+    assert sorted(timeline(db, alice)) == [ready, pending]
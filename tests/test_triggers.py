@@ -0,0 +1,122 @@
+# Columns and tables the schema keeps in step through triggers: counters,
+# the inbox, media reference counts, the user search index, post versions
+# and the typeahead change stamps.
+import mom
+from conftest import add_message, add_post, add_user
+
+
+def user(conn, user_id):
+    return conn.execute("SELECT * FROM users WHERE id=?", (user_id,)).fetchone()
+
+
+def post(conn, post_id):
+    return conn.execute("SELECT * FROM posts WHERE id=?", (post_id,)).fetchone()
+
+
+def test_migrations_reach_latest_version_once(db):
+    assert db.execute("PRAGMA user_version").fetchone()[0] == len(mom.MIGRATIONS)
+    mom.init_db()
+    assert mom.schema_version() == len(mom.MIGRATIONS)
+
+
+def test_follower_and_post_counters(db):
+    alice, bob = add_user(db, "alice"), add_user(db, "bob")
+    db.execute("INSERT INTO followers(user_id, follower_id) VALUES (?, ?)", (bob, alice))
+    add_post(db, bob)
+    add_post(db, bob)
+    db.commit()
+    assert (user(db, bob)["followers_count"], user(db, bob)["posts_count"]) == (1, 2)
+    assert user(db, alice)["following_count"] == 1
+
+    db.execute("DELETE FROM followers WHERE user_id=? AND follower_id=?", (bob, alice))
+    db.commit()
+    assert user(db, bob)["followers_count"] == 0
+    assert user(db, alice)["following_count"] == 0
+
+
+def test_like_and_comment_counters_match_recount(db):
+    alice, bob = add_user(db, "alice"), add_user(db, "bob")
+    pid = add_post(db, bob)
+    db.execute("INSERT INTO likes(post_id, user_id) VALUES (?, ?)", (pid, alice))
+    db.execute("INSERT INTO likes(post_id, user_id) VALUES (?, ?)", (pid, bob))
+    db.execute("INSERT INTO comments(post_id, user_id, comment, timestamp, ts) VALUES (?, ?, 'x', '', 1)",
+               (pid, alice))
+    db.execute("DELETE FROM likes WHERE user_id=?", (bob,))
+    db.commit()
+    assert (post(db, pid)["like_count"], post(db, pid)["comment_count"]) == (1, 1)
+
+    before = [tuple(r) for r in db.execute("SELECT * FROM posts")]
+    mom.recount_counters(db.cursor())
+    assert [tuple(r) for r in db.execute("SELECT * FROM posts")] == before
+
+
+def test_inbox_tracks_latest_message_and_unread(db):
+    alice, bob = add_user(db, "alice"), add_user(db, "bob")
+    add_message(db, alice, bob, "one")
+    last = add_message(db, alice, bob, "two")
+    rows = {r["user_id"]: r for r in db.execute("SELECT * FROM inbox")}
+    assert rows[alice]["last_message_id"] == rows[bob]["last_message_id"] == last
+    assert (rows[alice]["unread"], rows[bob]["unread"]) == (0, 2)
+
+    conversation = db.execute("SELECT conversation_id FROM messages WHERE id=?", (last,)).fetchone()[0]
+    assert conversation == mom.conversation_key(alice, bob)
+
+
+def test_media_reference_counts(db):
+    add_user(db, "alice", photo="a.jpg")
+    bob = add_user(db, "bob", photo="a.jpg")
+    pid = add_post(db, bob, media="p.jpg")
+    add_post(db, bob)     # a post without media holds no reference
+
+    def refs():
+        return dict(db.execute("SELECT name, refs FROM media").fetchall())
+
+    assert refs() == {"a.jpg": 2, "p.jpg": 1}
+    db.execute("UPDATE users SET photo='b.jpg' WHERE id=?", (bob,))
+    db.execute("DELETE FROM posts WHERE id=?", (pid,))
+    db.commit()
+    assert refs() == {"a.jpg": 1, "b.jpg": 1, "p.jpg": 0}
+
+    mom.recount_media(db.cursor())
+    assert refs() == {"a.jpg": 1, "b.jpg": 1}
+
+
+def test_user_search_index_follows_renames(db):
+    uid = add_user(db, "noor", "Noor Islam")
+
+    def match(text):
+        return [r[0] for r in db.execute("SELECT rowid FROM users_fts WHERE users_fts MATCH ?",
+                                         ('"' + text + '"',))]
+
+    assert match("isla") == [uid]
+    db.execute("UPDATE users SET fullname='Noor Khan' WHERE id=?", (uid,))
+    db.commit()
+    assert match("isla") == [] and match("khan") == [uid]
+
+
+def test_post_version_bumps_only_on_visible_change(db):
+    alice, bob = add_user(db, "alice"), add_user(db, "bob")
+    pid = add_post(db, bob, "hello")
+    start = post(db, pid)["version"]
+
+    db.execute("INSERT INTO likes(post_id, user_id) VALUES (?, ?)", (pid, alice))
+    db.commit()
+    assert post(db, pid)["version"] == start + 1
+    db.execute("UPDATE posts SET caption='hello' WHERE id=?", (pid,))
+    db.commit()
+    assert post(db, pid)["version"] == start + 1
+    db.execute("UPDATE posts SET caption='changed' WHERE id=?", (pid,))
+    db.commit()
+    assert post(db, pid)["version"] == start + 2
+
+
+def test_index_seq_stamps_user_changes(db):
+    alice, bob = add_user(db, "alice"), add_user(db, "bob")
+    assert user(db, bob)["index_seq"] > user(db, alice)["index_seq"]
+
+    db.execute("UPDATE users SET password='x' WHERE id=?", (alice,))
+    db.commit()
+    assert user(db, alice)["index_seq"] < user(db, bob)["index_seq"]
+    db.execute("UPDATE users SET fullname='Alice B' WHERE id=?", (alice,))
+    db.commit()
+    assert user(db, alice)["index_seq"] > user(db, bob)["index_seq"]
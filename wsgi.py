@@ -0,0 +1,13 @@
+# Production entry point. Apply migrations once per deploy, then start
+# the workers:
+#
+#   flask --app mom migrate
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Any WSGI server works the same way: point it at wsgi:app.
+from mom import MIGRATIONS, create_app, schema_version
+
+if schema_version() < len(MIGRATIONS):
+    raise RuntimeError("The database schema is out of date; run `flask --app mom migrate` first.")
+
+app = create_app()